@@ -0,0 +1,58 @@
+"""
+Time the bootstrap module against resampling with DataFrame.sample in a loop.
+
+    python benchmarks/bench_bootstrap.py [n_trials] [n_bootstrap] [n_jobs]
+
+The loop is timed on a tenth of the resamples and scaled up.
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eyelinkparser import bootstrap
+
+
+def trials(n_trials, n_participants=60, seed=0):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'wid': rng.integers(0, n_participants, n_trials).astype(str),
+        'RT_second_visit': rng.gamma(2, 500, n_trials),
+        'accuracy': rng.integers(0, 2, n_trials).astype(float),
+    })
+    data.loc[::50, 'RT_second_visit'] = np.nan
+    return data
+
+
+def bootstrap_loop(data, n_bootstrap):
+    means = []
+    for _ in range(n_bootstrap):
+        sample = data.sample(n=len(data), replace=True)
+        means.append(sample['RT_second_visit'].mean())
+    return np.array(means)
+
+
+def main(n_trials=2500, n_bootstrap=10000, n_jobs=1):
+    data = trials(n_trials)
+    print(f"{n_trials} trials, {n_bootstrap} resamples")
+    t0 = time.perf_counter()
+    loop = bootstrap_loop(data, n_bootstrap // 10)
+    print(f"        loop: {(time.perf_counter() - t0) * 10:6.2f} s (scaled)")
+    for label, kwargs in (('mean', {}), ('mean/median/std', {'statistics': ['mean', 'median', 'std']}),
+                          ('stratified', {'strata': 'wid'}), ('clustered', {'cluster': 'wid'})):
+        t0 = time.perf_counter()
+        result = bootstrap(data, ['RT_second_visit', 'accuracy'], n_bootstrap=n_bootstrap, seed=0,
+                           n_jobs=n_jobs, **kwargs)
+        print(f"{label:>15}: {time.perf_counter() - t0:6.2f} s")
+        if label == 'mean':
+            means = result['RT_second_visit', 'mean']
+    print(f"Mean of means: loop {loop.mean():.1f}, vectorized {means.mean():.1f}")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,52 @@
+"""
+Peak memory and time of list-of-dicts versus columnar row accumulation.
+
+    python benchmarks/bench_columnar.py [n_samples]
+
+Peak memory is measured with tracemalloc while parsing and building the
+DataFrame, next to the memory held by the resulting frame.
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eyelinkparser import EyeLinkParser
+from synthetic import write_asc
+
+
+def run(path, columnar, by_type=False):
+    parser = EyeLinkParser(eye_folder=os.path.dirname(path), columnar=columnar)
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    df = parser.parse_asc_file(path, by_type=by_type)
+    elapsed = time.perf_counter() - t0
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return parser, df, elapsed, peak
+
+
+def main(n_samples=1000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'samples.asc')
+        n_lines = write_asc(path, n_samples)
+        print(f"{n_lines} lines, {os.path.getsize(path) / 1e6:.1f} MB")
+        frames = {}
+        for label, columnar, by_type in (('dicts', False, False), ('columnar', True, False),
+                                         ('by type', True, True)):
+            parser, frames[label], elapsed, peak = run(path, columnar, by_type)
+            parts = frames[label].values() if by_type else [frames[label]]
+            size = sum(df.memory_usage(deep=True).sum() for df in parts)
+            print(f"{label:>8}: {elapsed:6.2f} s  peak {peak / 1e6:8.1f} MB  frame {size / 1e6:7.1f} MB")
+        pd.testing.assert_frame_equal(frames['dicts'], parser.rows.to_frame(categorical=False))
+        print("Frames identical (categorical=False)")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
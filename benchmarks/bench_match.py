@@ -0,0 +1,85 @@
+"""
+Time DataProcessor.match() against the row-by-row version it replaced.
+
+    python benchmarks/bench_match.py [n_trials] [rows_per_visit]
+
+Uses a synthetic session of n_trials trials with 4 visits each and checks
+that both versions return identical records.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eyelinkparser import DataProcessor
+
+
+def session(n_trials, rows_per_visit, seed=0):
+    """ Trial data and eye data frames of a synthetic session. """
+    rng = np.random.default_rng(seed)
+    trials = pd.DataFrame({name: [0] * n_trials for name in DataProcessor.TRIAL_COLUMNS})
+    trials['trial_index'] = np.arange(1, n_trials + 1)
+    trials['wid'] = 'w0'
+    trials['graph'] = [[[1, 2], [3, 4], [5, 6], [], [], [], [], [], [], [], []]] * n_trials
+    trials['rewards'] = [list(rng.integers(-10, 10, 11))] * n_trials
+    trials['RT'] = rng.uniform(1000, 5000, n_trials)
+    n = n_trials * 4 * rows_per_visit
+    eye = pd.DataFrame({
+        'Type': rng.choice(['Gaze'] * 8 + ['Fixation', 'Saccade'], n),
+        'trial_index': np.repeat(np.arange(1, n_trials + 1), 4 * rows_per_visit),
+        'visit': np.tile(np.repeat(np.arange(4.), rows_per_visit), n_trials),
+        'Node': rng.integers(-1, 11, n).astype(float),
+        'Duration': rng.uniform(0, 1, n).round(3),
+        'Start_Node': rng.integers(-1, 11, n).astype(float),
+        'End_Node': rng.integers(-1, 11, n).astype(float),
+    })
+    return trials, eye
+
+
+def match_rows(processor):
+    """ match() as it was: one filter, to_dict and iterrows per trial and visit. """
+    processed_data = []
+    for trial_index in processor.trial_data['trial_index'].unique():
+        trial_data = processor.trial_data[processor.trial_data['trial_index'] == trial_index][DataProcessor.TRIAL_COLUMNS]
+        eye_trial = processor.eye_data[processor.eye_data['trial_index'] == trial_index]
+        for visit in range(4):
+            eye_visit = eye_trial[eye_trial['visit'] == visit]
+            processed_trial = trial_data.to_dict(orient='records')[0]
+            processed_trial['fixation'] = processor.process_fixation(eye_visit)
+            processed_trial['saccade'] = processor.process_saccade(eye_visit)
+            processed_trial['gaze'] = processor.count_gaze(eye_visit)
+            processed_trial['visit'] = visit
+            processed_data.append(processed_trial)
+    return processed_data
+
+
+def main(n_trials=500, rows_per_visit=200):
+    trials, eye = session(n_trials, rows_per_visit)
+    with tempfile.TemporaryDirectory() as tmp:
+        trial_path = os.path.join(tmp, 'trials.json')
+        eye_path = os.path.join(tmp, 'eye.csv')
+        trials.to_json(trial_path)
+        eye.to_csv(eye_path, index=False)
+        print(f"{n_trials} trials x 4 visits, {len(eye)} eye rows")
+        t0 = time.perf_counter()
+        rows = match_rows(DataProcessor(trial_path, eye_path))
+        t1 = time.perf_counter()
+        records = DataProcessor(trial_path, eye_path).match()
+        t2 = time.perf_counter()
+        long_data = DataProcessor(trial_path, eye_path).match(long=True)
+        t3 = time.perf_counter()
+    print(f"  rows: {t1 - t0:6.2f} s")
+    print(f" match: {t2 - t1:6.2f} s")
+    print(f"  long: {t3 - t2:6.2f} s  ({len(long_data)} rows)")
+    assert repr(rows) == repr(records)
+    print("Records identical")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
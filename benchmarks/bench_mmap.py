@@ -0,0 +1,45 @@
+"""
+Text reader versus memory-mapped bulk reader for parse_asc_file.
+
+    python benchmarks/bench_mmap.py [n_samples]
+
+Both runs use the columnar accumulator so the difference is the I/O and
+sample parsing path; the frames are checked to be identical.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eyelinkparser import EyeLinkParser
+from synthetic import write_asc
+
+
+def run(path, reader):
+    parser = EyeLinkParser(eye_folder=os.path.dirname(path), columnar=True)
+    t0 = time.perf_counter()
+    parser.parse_asc_file(path, reader=reader)
+    return parser.rows.to_frame(categorical=False), time.perf_counter() - t0
+
+
+def main(n_samples=2000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'samples.asc')
+        n_lines = write_asc(path, n_samples)
+        size = os.path.getsize(path) / 1e6
+        print(f"{n_lines} lines, {size:.1f} MB")
+        frames = {}
+        for reader in ('text', 'mmap'):
+            frames[reader], elapsed = run(path, reader)
+            print(f"{reader:>5}: {elapsed:7.2f} s  {n_lines / elapsed:12,.0f} lines/sec  {size / elapsed:7.1f} MB/s")
+        pd.testing.assert_frame_equal(frames['text'], frames['mmap'])
+        print("DataFrames identical")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,51 @@
+"""
+Throughput of EyeLinkParser.parse_asc_file per parsing engine.
+
+    python benchmarks/bench_parse_asc.py [n_samples]
+
+Writes a synthetic multi-million-line ASC file to a temporary directory,
+parses it with the regex, token and events engines and reports lines/sec.
+Checks that the token engine produces the same DataFrame as the regex
+engine, and the events engine too apart from the EBLINK lines only it reads.
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eyelinkparser import EyeLinkParser
+from synthetic import write_asc
+
+
+def run(path, engine):
+    parser = EyeLinkParser(eye_folder=os.path.dirname(path))
+    t0 = time.perf_counter()
+    df = parser.parse_asc_file(path, engine=engine)
+    return df, time.perf_counter() - t0
+
+
+def main(n_samples=2000000):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'samples.asc')
+        n_lines = write_asc(path, n_samples)
+        print(f"{n_lines} lines, {os.path.getsize(path) / 1e6:.1f} MB")
+        frames = {}
+        for engine in ('regex', 'token', 'events'):
+            frames[engine], elapsed = run(path, engine)
+            print(f"{engine:>6}: {elapsed:7.2f} s  {n_lines / elapsed:12,.0f} lines/sec")
+        pd.testing.assert_frame_equal(frames['regex'], frames['token'])
+        print("DataFrames identical")
+        events = frames['events']
+        blinks = events['Type'] == 'Blink'
+        pd.testing.assert_frame_equal(frames['regex'][frames['regex']['Type'] != 'Blink'].reset_index(drop=True),
+                                      events[~blinks].reset_index(drop=True)[list(frames['regex'].columns)])
+        print(f"Events engine identical apart from {blinks.sum()} Blink rows")
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,190 @@
+"""
+Time every stage of the processing pipeline at several scales.
+
+    python benchmarks/bench_pipeline.py [--scales small medium large] [--format csv]
+
+The start-up time of importing the package and of data_processor is
+measured first, in fresh interpreters. For every scale, synthetic sessions
+(experiment JSON and samples.asc) are written to a temporary directory and
+processed with data_processor, which times parsing, trial processing and
+writing per participant. Matching trial and eye data with DataProcessor,
+aligning eye data to the trial events and the batch
+TrialProcessor.process_trials are timed on top. The results are saved to
+benchmarks/results/ with the commit they were run on, and compared with the
+previous results file.
+"""
+
+import argparse
+import contextlib
+import glob
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import data_processor
+from eyelinkparser import DataProcessor, RunReport, TrialProcessor, __version__ as parser_version
+from eyelinkparser import JSONSerializer, eye_data_path
+from synthetic import write_session
+
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+VERSION = 'bench'
+# Commands whose start-up time is measured, each in a fresh interpreter
+IMPORTS = {
+    'python': ['-c', 'pass'],
+    'import eyelinkparser': ['-c', 'import eyelinkparser'],
+    'import EyeLinkParser': ['-c', 'from eyelinkparser import EyeLinkParser'],
+    'import TrialProcessor': ['-c', 'from eyelinkparser import TrialProcessor'],
+    'data_processor --help': [os.path.join(ROOT, 'data_processor.py'), '--help'],
+}
+# Scale name -> (participants, trials per participant); trials last 4 s at 1000 Hz
+SCALES = {
+    'small': (1, 20),
+    'medium': (2, 100),
+    'large': (4, 250),
+}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', nargs='+', default=['small', 'medium'], choices=list(SCALES))
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet', 'feather'])
+    parser.add_argument('--sampling-rate', type=int, default=1000)
+    parser.add_argument('--trial-duration', type=float, default=4.0)
+    parser.add_argument('--blink-rate', type=float, default=0.5, help="blinks per second")
+    parser.add_argument('--saccade-rate', type=float, default=4.0, help="saccades per second")
+    parser.add_argument('--output', default=None, help="results file (default: benchmarks/results/pipeline-<time>.json)")
+    return parser.parse_args(argv)
+
+
+@contextlib.contextmanager
+def working_directory(path):
+    cwd = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(cwd)
+
+
+def run_scale(name, args):
+    """ Generates and processes the sessions of one scale; returns its results. """
+    n_participants, n_trials = SCALES[name]
+    with tempfile.TemporaryDirectory() as tmp:
+        n_lines = 0
+        for i in range(n_participants):
+            n_lines += write_session(tmp, f'W{i}', f'P{i}', VERSION, n_trials, args.trial_duration,
+                                     args.sampling_rate, seed=i, blink_rate=args.blink_rate,
+                                     saccade_rate=args.saccade_rate)
+        with working_directory(tmp):
+            report_path = os.path.join(tmp, 'run_report.json')
+            data_processor.main([VERSION, '--force', '--format', args.format, '--report', report_path])
+            with open(report_path) as file:
+                stages = json.load(file)['stages']
+            # Stages data_processor does not run
+            report = RunReport()
+            report.add(stages)
+            eye_dir = f'data/processed/{VERSION}/eyetracking'
+            for i in range(n_participants):
+                trial_path = f'data/processed/{VERSION}/trial_data/W{i}.json'
+                with report.stage('load_trials_eye_data', f'P{i}'):
+                    processor = DataProcessor(trial_path, eye_data_path(eye_dir, f'P{i}', args.format))
+                with report.stage('match', f'P{i}') as stage:
+                    stage.count(rows=len(processor.match()))
+                with report.stage('align_events', f'P{i}') as stage:
+                    stage.count(rows=len(processor.align_events()))
+                data = pd.DataFrame(JSONSerializer().load(f'data/exp/{VERSION}/W{i}.json')['trial_data'])
+                with report.stage('process_trials', f'W{i}') as stage:
+                    TrialProcessor(VERSION).process_trials(data, f'W{i}')
+                    stage.count(trials=len(data))
+    result = report.to_dict()
+    result['parameters'] = {'participants': n_participants, 'trials': n_trials, 'asc_lines': n_lines,
+                            'format': args.format, 'sampling_rate': args.sampling_rate,
+                            'trial_duration': args.trial_duration, 'blink_rate': args.blink_rate,
+                            'saccade_rate': args.saccade_rate}
+    return result
+
+
+def import_times(repeat=5):
+    """ Best wall time of every IMPORTS command over repeat runs, in seconds. """
+    times = {}
+    for name, command in IMPORTS.items():
+        best = None
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            subprocess.run([sys.executable] + command, cwd=ROOT, capture_output=True, check=True)
+            elapsed = time.perf_counter() - t0
+            best = elapsed if best is None else min(best, elapsed)
+        times[name] = best
+    return times
+
+
+def commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def previous_results(exclude):
+    paths = sorted(path for path in glob.glob(os.path.join(RESULTS_DIR, 'pipeline-*.json'))
+                   if os.path.abspath(path) != os.path.abspath(exclude))
+    if not paths:
+        return None, None
+    with open(paths[-1]) as file:
+        return paths[-1], json.load(file)
+
+
+def print_results(results, previous=None):
+    before = (previous or {}).get('import', {})
+    print("\nstart-up:")
+    for name, elapsed in results['import'].items():
+        line = f"  {name:>22}: {elapsed:8.3f} s"
+        if before.get(name):
+            line += f"  ({elapsed / before[name]:.2f}x previous)"
+        print(line)
+    for scale, result in results['scales'].items():
+        before = (previous or {}).get('scales', {}).get(scale, {}).get('totals', {})
+        print(f"\n{scale}: {result['parameters']['participants']} participant(s) x "
+              f"{result['parameters']['trials']} trials, {result['parameters']['asc_lines']:,} ASC lines")
+        for stage, total in result['totals'].items():
+            line = f"  {stage:>22}: {total['wall_s']:8.3f} s"
+            for key in ('lines', 'rows', 'trials'):
+                if total.get(key) and total['wall_s'] > 0:
+                    line += f"  {total[key] / total['wall_s']:12,.0f} {key}/s"
+                    break
+            if stage in before and before[stage]['wall_s'] > 0:
+                line += f"  ({total['wall_s'] / before[stage]['wall_s']:.2f}x previous)"
+            print(line)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = {
+        'started': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit(),
+        'parser_version': parser_version,
+        'import': import_times(),
+        'scales': {name: run_scale(name, args) for name in args.scales},
+    }
+    path = args.output or os.path.join(RESULTS_DIR, time.strftime('pipeline-%Y%m%d-%H%M%S.json'))
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(results, file, indent=4)
+    previous_path, previous = previous_results(path)
+    if previous_path:
+        print(f"\nCompared with {os.path.relpath(previous_path)}")
+    print_results(results, previous)
+    print(f"\nResults saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
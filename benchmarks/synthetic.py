@@ -0,0 +1,189 @@
+"""
+Synthetic EyeLink ASC files and experiment JSON for benchmarking.
+
+Participant recordings cannot be shared, so the benchmarks generate files
+with the same line formats that EyeLinkParser reads: sample lines, EFIX,
+ESACC and EBLINK events and MSG lines with a JSON payload carrying the
+python-side "time" and "event". The experiment JSON of the same session
+has the same trials and event times, as TrialProcessor reads it.
+"""
+
+import json
+import math
+import os
+import random
+
+NODE_POSITIONS = [
+    [960.0, 162.0],
+    [755.6377710017841, 222.00616458981358],
+    [616.159105755992, 382.97312508528694],
+    [585.8474949690074, 593.7950088673017],
+    [674.3266608940903, 787.5373574313177],
+    [853.5050935139395, 902.68834402628],
+    [1066.4949064860602, 902.68834402628],
+    [1245.6733391059095, 787.537357431318],
+    [1334.1525050309926, 593.7950088673018],
+    [1303.840894244008, 382.97312508528705],
+    [1164.3622289982159, 222.00616458981352]
+]
+
+
+# Tracker clock (ms) and python clock (s) at the start of a recording. The
+# python clock drifts slowly against the tracker clock, which is what the
+# drift check messages correct for.
+T_EL = 2000000
+T_PY = 1700000000.0
+DRIFT = 1.00001
+
+
+def python_time(t_el):
+    return T_PY + (t_el - T_EL) / 1000 * DRIFT
+
+
+def tracker_time(t_py):
+    return T_EL + round((t_py - T_PY) / DRIFT * 1000)
+
+
+def trials(n_trials, trial_duration=4.0, seed=0):
+    """
+    The trials of a synthetic session as in the experiment JSON: a two-step
+    graph from start node 0, rewards and the events of the trial, with
+    python times. Trial k starts at T_PY + k * trial_duration seconds.
+    """
+    rng = random.Random(seed)
+    session = []
+    for k in range(n_trials):
+        nodes = rng.sample(range(1, 11), 6)
+        first = nodes[:2]
+        graph = [[] for _ in range(11)]
+        graph[0] = first
+        graph[first[0]] = nodes[2:4]
+        graph[first[1]] = nodes[4:rng.choice((5, 6))]
+        rewards = [None] + [rng.randint(-10, 10) for _ in range(10)]
+        t0 = T_PY + k * trial_duration
+        t1 = t0 + rng.uniform(0.1, 0.35) * trial_duration
+        t2 = t1 + rng.uniform(0.1, 0.35) * trial_duration
+        state1 = rng.choice(first)
+        state2 = rng.choice(graph[state1])
+        events = [
+            {'event': 'initialize', 'time': t0 + 0.001},
+            {'event': 'visit', 'state': 0, 'time': t0 + 0.002, 'initial': True},
+            {'event': 'select', 'selected': state1, 'time': t1 - 0.001},
+            {'event': 'visit', 'state': state1, 'time': t1},
+            {'event': 'select', 'selected': state2, 'time': t2 - 0.001},
+            {'event': 'visit', 'state': state2, 'time': t2},
+        ]
+        session.append({'trial': {'graph': graph, 'rewards': rewards, 'start': 0}, 'events': events})
+    return session
+
+
+def experiment(n_trials, trial_duration=4.0, n_practice=5, seed=0):
+    """ Experiment JSON of a synthetic session, with practice trials before it. """
+    practice = trials(n_practice, trial_duration, seed=seed + 1)
+    return {'practice_data': practice, 'trial_data': trials(n_trials, trial_duration, seed)}
+
+
+def messages(session, trial_duration=4.0):
+    """ (tracker time, python time, event) of the MSG lines of a session, in order. """
+    result = []
+    for k, trial in enumerate(session):
+        t0 = T_PY + k * trial_duration
+        result.append((tracker_time(t0), t0, 'drift check'))
+        for event in trial['events']:
+            result.append((tracker_time(event['time']), event['time'], event['event']))
+    return sorted(result, key=lambda message: message[0])
+
+
+def asc_lines(n_samples, sampling_rate=1000, trial_length=4000, seed=0, blink_rate=0.5, saccade_rate=4.0):
+    """
+    Yields the lines of a synthetic ASC recording with n_samples samples,
+    with a trial every trial_length samples and blinks and saccades at
+    about blink_rate and saccade_rate per second. The MSG lines are those
+    of trials(n_trials, trial_duration, seed) for the same session.
+
+    Timestamps are whole milliseconds, as EyeLinkParser reads them: sample
+    i is stamped with the millisecond it falls in at sampling_rate, so rates
+    that do not divide 1000 keep their average rate and rates above 1 kHz
+    repeat timestamps.
+    """
+    if sampling_rate <= 0:
+        raise ValueError(f"Sampling rate must be positive: {sampling_rate}")
+    rng = random.Random(seed)
+    trial_duration = trial_length / sampling_rate
+    session = trials(math.ceil(n_samples / trial_length), trial_duration, seed)
+    queue = messages(session, trial_duration)
+    blink_p = blink_rate / sampling_rate
+    saccade_p = saccade_rate / sampling_rate
+    t_el = T_EL
+    yield '** CONVERTED FROM samples.edf\n'
+    yield '** DATE: Thu Jan  1 00:00:00 2024\n'
+    yield 'MSG\t%d !MODE RECORD CORE %d 0 0 R\n' % (t_el, sampling_rate)
+    yield 'START\t%d \tRIGHT\tSAMPLES\tEVENTS\n' % t_el
+    yield 'SAMPLES\tGAZE\tRIGHT\tRATE\t%d.00\tTRACKING\tCR\tFILTER\t2\n' % sampling_rate
+    fix_x, fix_y = rng.choice(NODE_POSITIONS)
+    fix_start = t_el
+    blink_until = -1
+    i_message = 0
+    for i in range(n_samples):
+        t_el = T_EL + i * 1000 // sampling_rate
+        while i_message < len(queue) and queue[i_message][0] <= t_el:
+            yield _message(*queue[i_message])
+            i_message += 1
+        roll = rng.random()
+        if blink_until < 0 and roll < blink_p:
+            blink_until = t_el + 100
+            yield 'SBLINK R %d\n' % t_el
+        if blink_until >= 0:
+            if t_el >= blink_until:
+                yield 'EBLINK R %d\t%d\t%d\n' % (blink_until - 100, t_el, t_el - blink_until + 100)
+                blink_until = -1
+            yield '%d\t   .\t   .\t    0.0\t...\n' % t_el
+            continue
+        if roll < saccade_p and t_el > fix_start:
+            # Close the current fixation and saccade to a new node
+            new_x, new_y = rng.choice(NODE_POSITIONS)
+            yield 'EFIX R   %d\t%d\t%d\t  %.1f\t  %.1f\t   %d\n' % (
+                fix_start, t_el, t_el - fix_start + 1, fix_x, fix_y, rng.randint(1500, 5000))
+            yield 'SSACC R  %d\n' % t_el
+            yield 'ESACC R  %d\t%d\t%d\t  %.1f\t  %.1f\t  %.1f\t  %.1f\t   %.2f\t     %d\n' % (
+                t_el, t_el + 12, 13, fix_x, fix_y, new_x, new_y, rng.uniform(0.5, 12), rng.randint(50, 600))
+            yield 'SFIX R   %d\n' % (t_el + 13)
+            fix_x, fix_y, fix_start = new_x, new_y, t_el + 13
+        x = fix_x + rng.gauss(0, 25)
+        y = fix_y + rng.gauss(0, 25)
+        yield '%d\t  %.1f\t  %.1f\t %.1f\t...\n' % (t_el, abs(x), abs(y), rng.uniform(1500, 5000))
+    yield 'END\t%d \tSAMPLES\tEVENTS\tRES\t  38.00\t  33.00\n' % t_el
+
+
+def _message(t_el, t_py, event):
+    return 'MSG\t%d %s\n' % (t_el, json.dumps({'time': round(t_py, 6), 'event': event}))
+
+
+def write_asc(path, n_samples, **kwargs):
+    """ Writes a synthetic ASC file and returns the number of lines written. """
+    n_lines = 0
+    with open(path, 'w', encoding='ISO-8859-1') as file:
+        for line in asc_lines(n_samples, **kwargs):
+            if line:
+                file.write(line)
+                n_lines += 1
+    return n_lines
+
+
+def write_session(root, wid, pid, version='bench', n_trials=100, trial_duration=4.0, sampling_rate=1000,
+                  n_practice=5, seed=0, **kwargs):
+    """
+    Writes the experiment JSON and samples.asc of one synthetic session in
+    the layout data_processor reads: <root>/data/exp/<version>/<wid>.json
+    and <root>/data/eyelink/<pid>/samples.asc. kwargs go to asc_lines.
+    Returns the number of ASC lines written.
+    """
+    exp_dir = os.path.join(root, 'data', 'exp', version)
+    eye_dir = os.path.join(root, 'data', 'eyelink', pid)
+    os.makedirs(exp_dir, exist_ok=True)
+    os.makedirs(eye_dir, exist_ok=True)
+    with open(os.path.join(exp_dir, wid + '.json'), 'w') as file:
+        json.dump(experiment(n_trials, trial_duration, n_practice, seed), file)
+    trial_length = round(trial_duration * sampling_rate)
+    return write_asc(os.path.join(eye_dir, 'samples.asc'), n_trials * trial_length,
+                     sampling_rate=sampling_rate, trial_length=trial_length, seed=seed, **kwargs)
@@ -1,22 +1,68 @@
-import numpy as np
 import sys
-import json
-import pandas as pd
-import subprocess
+import argparse
+import asyncio
+import hashlib
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from config import VERSION
 import os
-from eyelinkparser import EyeLinkParser
-from eyelinkparser import TrialProcessor as tp
+# Only light modules are imported here; the parser, trial processing and
+# pandas are imported by the workers that use them
+from eyelinkparser import Manifest, __version__ as parser_version
+from eyelinkparser import write_eye_data, eye_data_path, FORMATS
+from eyelinkparser import JSONSerializer, JSON_MODES
+from eyelinkparser import RunReport, Stage
 
-# Use version number provided as an argument if available
-if len(sys.argv) > 1:
-    VERSION = sys.argv[1]
 
-# Instantiate the TrialProcessor and EyeLinkParser with the version
-trial_processor = tp(VERSION)
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Process experiment and eye-tracking data.")
+    # Use version number provided as an argument if available
+    parser.add_argument('version', nargs='?', default=VERSION,
+                        help=f"experiment version to process (default: {VERSION})")
+    parser.add_argument('-j', '--jobs', type=int, default=1,
+                        help="number of worker processes (default: 1)")
+    parser.add_argument('--format', choices=FORMATS, default='csv',
+                        help="output format of the eye-tracking data (default: csv)")
+    parser.add_argument('--force', action='store_true',
+                        help="reprocess every input, even if the manifest says it is unchanged")
+    parser.add_argument('--json-mode', choices=JSON_MODES, default='indent',
+                        help="layout of the processed trial data: indented, compact or JSON lines (default: indent)")
+    parser.add_argument('--corpus', action='store_true',
+                        help="merge the processed trial data of all participants into one parquet corpus")
+    parser.add_argument('--report', default=None,
+                        help="path of the JSON run report (default: data/processed/<version>/run_report.json)")
+    parser.add_argument('--profile', action='store_true',
+                        help="dump cProfile stats of every stage to data/processed/<version>/profile/, "
+                             "each holding only the stage's own calls, e.g. parse_asc apart from write_eye_data")
+    parser.add_argument('--gaze', choices=['all', 'none', 'bin'], default='all',
+                        help="gaze samples to keep: all, none, or aggregated to time bins per node (default: all)")
+    parser.add_argument('--gaze-step', type=int, default=1,
+                        help="keep only every Nth gaze sample (default: 1)")
+    parser.add_argument('--gaze-bin', type=float, default=0.05,
+                        help="with --gaze bin, width of the time bins in seconds (default: 0.05)")
+    parser.add_argument('--async', dest='use_async', action='store_true',
+                        help="read the next inputs and write outputs in the background while parsing "
+                             "in one process; cannot be combined with --jobs")
+    parser.add_argument('--in-flight', type=int, default=2,
+                        help="with --async, most inputs read but not yet written at a time (default: 2)")
+    parser.add_argument('--write-queue', type=int, default=2,
+                        help="with --async, most parsed outputs waiting to be written (default: 2)")
+    args = parser.parse_args(argv)
+    if args.use_async and args.jobs > 1:
+        parser.error("--async parses in one process and cannot be combined with --jobs")
+    if args.gaze_step < 1:
+        parser.error("--gaze-step must be at least 1")
+    if not args.gaze_bin > 0:
+        parser.error("--gaze-bin must be positive")
+    if args.in_flight < 1:
+        parser.error("--in-flight must be at least 1")
+    if args.write_queue < 1:
+        parser.error("--write-queue must be at least 1")
+    return args
 
 
 def save_as_csv(data, filepath):
+    import pandas as pd
     # Convert dictionary to DataFrame and save as CSV
     if isinstance(data, pd.DataFrame):
         data.to_csv(filepath, index=False)
@@ -25,45 +71,300 @@ def save_as_csv(data, filepath):
         df.to_csv(filepath, index=False)
 
 
+def process_trial_file(fn, version, output_path, json_mode='indent', profile_dir=None):
+    """
+    Processes one experiment JSON file; runs in a worker process. Returns
+    the run report records of its stages and the SHA-256 of the file.
+    """
+    from eyelinkparser import TrialProcessor as tp
+    report = RunReport(profile_dir)
+    wid = os.path.basename(fn).replace('.json', '')
+    trial_processor = tp(version, serializer=JSONSerializer(mode=json_mode))
+    with report.stage('process_file', wid):
+        print(f"Processing file: {fn}")
+        # The file is read once, both to process it and for the manifest
+        data = read_bytes(fn)
+        sha256 = hashlib.sha256(data).hexdigest()
+        # Trials are written as they are processed instead of collected first
+        processed_data = trial_processor.process_data(trial_processor.serializer.loads(data), wid, lazy=True)
+        del data
+    if processed_data is not None:
+        process_stage = Stage('process_trial', wid)
+        with report.stage('write_trials', wid) as write_stage:
+            trials = report.timed(processed_data, process_stage, within=write_stage)
+            n_trials = trial_processor.save_data(trials, output_path)
+        process_stage.count(trials=n_trials)
+        write_stage.count(trials=n_trials)
+        print(f"Trial data saved to {output_path}")
+    return report.records(), sha256
 
-def main():
-    exp_dir = f"data/exp/{VERSION}/"
+
+def process_participant(participant_path, asc_file, output_eye_file, fmt='csv', profile_dir=None,
+                        parser_options=None):
+    """
+    Parses one participant's samples.asc; runs in a worker process. Returns
+    the run report records of its stages and the SHA-256 of samples.asc,
+    hashed as it is parsed. parser_options go to EyeLinkParser, e.g.
+    gaze='bin'.
+    """
+    from eyelinkparser import EyeLinkParser
+    report = RunReport(profile_dir)
+    name = os.path.basename(participant_path)
+    # Every worker builds its own parser since the parser keeps state
+    parser = EyeLinkParser(eye_folder=participant_path, asc_encoding='ISO-8859-1', **(parser_options or {}))
+    parse_stage = Stage('parse_asc', name)
+    digest = hashlib.sha256()
+    with report.stage('write_eye_data', name) as write_stage:
+        # Parse and write trial by trial to keep memory bounded on long sessions
+        chunks = report.timed(parser.iter_asc_chunks(asc_file, by_trial=True, digest=digest), parse_stage, within=write_stage)
+        write_stage.count(rows=write_eye_data(chunks, output_eye_file, fmt))
+    parse_stage.count(lines=parser.n_lines)
+    print(f"Eye-tracking data saved to {output_eye_file}")
+    return report.records(), digest.hexdigest()
+
+
+def run_tasks(func, tasks, jobs=1):
+    """
+    Runs func(*args) for every (name, args) in tasks, in a process pool if
+    jobs > 1, and yields (name, result, error) in the order of tasks. A task
+    that raises is reported with its traceback instead of aborting the run.
+    """
+    if jobs <= 1:
+        for name, args in tasks:
+            try:
+                yield name, func(*args), None
+            except Exception:
+                yield name, None, traceback.format_exc()
+        return
+    with ProcessPoolExecutor(max_workers=jobs) as executor:
+        futures = [(name, executor.submit(func, *args)) for name, args in tasks]
+        for name, future in futures:
+            try:
+                yield name, future.result(), None
+            except Exception:
+                yield name, None, traceback.format_exc()
+
+
+def read_bytes(path):
+    with open(path, 'rb') as file:
+        return file.read()
+
+
+def read_input(path):
+    """ The bytes of an input file and their SHA-256 for the manifest, so the file is read only once. """
+    data = read_bytes(path)
+    return data, hashlib.sha256(data).hexdigest()
+
+
+def prepare_trial_file(data, fn, version, output_path, json_mode='indent', profile_dir=None):
+    """
+    The processing half of process_trial_file, on the prefetched bytes of
+    the experiment JSON. Returns the report and a function that writes the
+    output.
+    """
+    from eyelinkparser import TrialProcessor as tp
+    report = RunReport(profile_dir)
+    wid = os.path.basename(fn).replace('.json', '')
+    trial_processor = tp(version, serializer=JSONSerializer(mode=json_mode))
+    with report.stage('process_file', wid) as stage:
+        processed_data = trial_processor.process_data(trial_processor.serializer.loads(data), wid)
+        stage.count(trials=len(processed_data or []))
+
+    def write():
+        if processed_data is None:
+            return
+        with report.stage('write_trials', wid) as stage:
+            stage.count(trials=trial_processor.save_data(processed_data, output_path))
+        print(f"Trial data saved to {output_path}")
+    return report, write
+
+
+def prepare_participant(data, participant_path, asc_file, output_eye_file, fmt='csv', profile_dir=None,
+                        parser_options=None):
+    """
+    The parsing half of process_participant, on the prefetched bytes of
+    samples.asc. Returns the report and a function that writes the output.
+    """
+    from eyelinkparser import EyeLinkParser
+    report = RunReport(profile_dir)
+    name = os.path.basename(participant_path)
+    parser = EyeLinkParser(eye_folder=participant_path, asc_encoding='ISO-8859-1', columnar=True,
+                           **(parser_options or {}))
+    with report.stage('parse_asc', name) as stage:
+        frame = parser.parse_asc_buffer(data)
+        stage.count(lines=data.count(b'\n'), rows=len(frame))
+        stage.count_events(frame)
+
+    def write():
+        with report.stage('write_eye_data', name) as stage:
+            stage.count(rows=write_eye_data(frame, output_eye_file, fmt))
+        print(f"Eye-tracking data saved to {output_eye_file}")
+    return report, write
+
+
+async def ingest(tasks, on_result, in_flight=2, write_queue=2):
+    """
+    Runs (name, prepare, input_path, args) tasks with reading, parsing and
+    writing overlapped: inputs are read in I/O threads ahead of the one
+    being parsed, parsed one at a time in a parse thread by
+    prepare(data, *args), and written by a background writer fed through a
+    queue of at most write_queue outputs. At most in_flight inputs are held
+    between being read and written, which bounds memory. on_result(name,
+    (records, sha256), error) is called on the event loop as every task
+    finishes, with the SHA-256 of the input hashed in the I/O thread that
+    read it. If on_result raises, it is called again with the traceback as
+    the task's error.
+    """
+    loop = asyncio.get_running_loop()
+    slots = asyncio.Semaphore(in_flight)
+    queue = asyncio.Queue(maxsize=write_queue)
+    with ThreadPoolExecutor(max_workers=in_flight, thread_name_prefix='read') as io_pool, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix='parse') as parse_pool, \
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix='write') as write_pool:
+
+        def deliver(name, result, error):
+            # A failing on_result must neither stop the writer nor leave a producer waiting
+            try:
+                on_result(name, result, error)
+            except Exception:
+                if error is None:
+                    deliver(name, None, traceback.format_exc())
+                else:
+                    traceback.print_exc()
+
+        async def produce(name, prepare, input_path, args):
+            async with slots:
+                try:
+                    with RunReport().stage('read_input', name) as read_stage:
+                        data, sha256 = await loop.run_in_executor(io_pool, read_input, input_path)
+                        read_stage.count(bytes=len(data))
+                    report, write = await loop.run_in_executor(parse_pool, prepare, data, *args)
+                    del data
+                    report.stages.insert(0, read_stage)
+                    done = loop.create_future()
+                    await queue.put((name, report, write, sha256, done))
+                    await done  # the slot is held until the output is written
+                except Exception:
+                    deliver(name, None, traceback.format_exc())
+
+        async def writer():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                name, report, write, sha256, done = item
+                try:
+                    await loop.run_in_executor(write_pool, write)
+                    result, error = (report.records(), sha256), None
+                except Exception:
+                    result, error = None, traceback.format_exc()
+                finally:
+                    done.set_result(None)
+                deliver(name, result, error)
+
+        writing = asyncio.create_task(writer())
+        await asyncio.gather(*(produce(*task) for task in tasks))
+        await queue.put(None)
+        await writing
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    version = args.version
+    exp_dir = f"data/exp/{version}/"
     eyetrack_dir = f"data/eyelink/"
-    processed_trial_dir = f"data/processed/{VERSION}/trial_data/"
-    processed_eye_dir = f"data/processed/{VERSION}/eyetracking/"
+    processed_trial_dir = f"data/processed/{version}/trial_data/"
+    processed_eye_dir = f"data/processed/{version}/eyetracking/"
+    manifest = Manifest(f"data/processed/{version}/manifest.json")
+    profile_dir = f"data/processed/{version}/profile" if args.profile else None
+    report = RunReport(profile_dir)
+    parser_options = {'gaze': args.gaze, 'gaze_step': args.gaze_step, 'gaze_bin': args.gaze_bin}
+    # Eye outputs also depend on the gaze options, so the manifest records them
+    eye_version = parser_version
+    if args.gaze != 'all' or args.gaze_step != 1:
+        eye_version += f" gaze={args.gaze} step={args.gaze_step} bin={args.gaze_bin}"
+    # and trial outputs on the JSON mode, since indent and compact share the .json name
+    trial_version = parser_version
+    if args.json_mode != 'indent':
+        trial_version += f" json={args.json_mode}"
 
     # Ensure output directories exist
     os.makedirs(processed_trial_dir, exist_ok=True)
     os.makedirs(processed_eye_dir, exist_ok=True)
 
-    
     # Process experimental trial data
+    io_paths = {}  # task name -> (input, output, version), for the manifest
+    trial_tasks = []
     for file in sorted(os.listdir(exp_dir)):
         if 'test' in file or 'txt' in file:
             continue
         fn = os.path.join(exp_dir, file)
-        print(f"Processing trial data: {fn}")
-        processed_data = trial_processor.process_file(fn)
-        if processed_data:
-            wid = file.replace('.json', '')
-            output_path = os.path.join(processed_trial_dir, f'{wid}.json')
-            trial_processor.save_data(processed_data, output_path)
-            print(f"Trial data saved to {output_path}")
+        wid = file.replace('.json', '')
+        output_path = os.path.join(processed_trial_dir, wid + JSONSerializer(mode=args.json_mode).extension)
+        trial_tasks.append((fn, (fn, version, output_path, args.json_mode, profile_dir)))
+        io_paths[fn] = (fn, output_path, trial_version)
 
     # Process eye-tracking data
+    eye_tasks = []
     for participant_dir in sorted(os.listdir(eyetrack_dir)):
         participant_path = os.path.join(eyetrack_dir, participant_dir)
         if os.path.isdir(participant_path):
             asc_file = os.path.join(participant_path, 'samples.asc')
             if os.path.exists(asc_file):
-                parser = EyeLinkParser(eye_folder=participant_path, asc_encoding='ISO-8859-1')
-                processed_eye_data = parser.parse_asc_file(asc_file)
-                print(f"Processed data for {participant_dir}")
+                output_eye_file = eye_data_path(processed_eye_dir, participant_dir, args.format)
+                eye_tasks.append((participant_dir, (participant_path, asc_file, output_eye_file, args.format, profile_dir,
+                                                      parser_options)))
+                io_paths[participant_dir] = (asc_file, output_eye_file, eye_version)
+
+    # Only new or changed inputs are reprocessed unless --force is given
+    if not args.force:
+        current = {name for name, (input_path, output_path, version) in io_paths.items()
+                   if manifest.is_current(input_path, output_path, version)}
+        trial_tasks = [task for task in trial_tasks if task[0] not in current]
+        eye_tasks = [task for task in eye_tasks if task[0] not in current]
+        if current:
+            manifest.save()  # keeps refreshed mtimes of touched but unchanged inputs
+        print(f"{len(current)} input(s) unchanged, {len(trial_tasks) + len(eye_tasks)} to process")
+
+    failures = []
+
+    def finish(name, result, error):
+        if error is None:
+            records, sha256 = result
+            print(f"Processed data for {name}")
+            report.add(records)
+            input_path, output_path, version = io_paths[name]
+            if os.path.exists(output_path):
+                manifest.record(input_path, output_path, version, sha256)
+                manifest.save()
+        else:
+            failures.append(name)
+            print(f"Error processing {name}:\n{error}", file=sys.stderr)
+
+    if args.use_async:
+        tasks = ([(name, prepare_trial_file, task_args[0], task_args) for name, task_args in trial_tasks] +
+                 [(name, prepare_participant, task_args[1], task_args) for name, task_args in eye_tasks])
+        asyncio.run(ingest(tasks, finish, args.in_flight, args.write_queue))
+    else:
+        for func, tasks in ((process_trial_file, trial_tasks), (process_participant, eye_tasks)):
+            for name, result, error in run_tasks(func, tasks, args.jobs):
+                finish(name, result, error)
+
+    if args.corpus:
+        from eyelinkparser import build_corpus
+        with report.stage('build_corpus') as stage:
+            corpus = build_corpus(processed_trial_dir, f"data/processed/{version}/corpus", force=args.force)
+            stage.count(trials=len(corpus))
+        print(f"Corpus of {len(corpus.wids)} participant(s), {len(corpus)} trials")
+
+    report_path = args.report or f"data/processed/{version}/run_report.json"
+    report.save(report_path)
+    print(f"Run report saved to {report_path}")
+
+    if failures:
+        print(f"{len(failures)} input(s) failed: {', '.join(failures)}", file=sys.stderr)
+    return 1 if failures else 0
 
-                output_eye_file = os.path.join(processed_eye_dir, f'{participant_dir}.csv')
-                save_as_csv(processed_eye_data, output_eye_file)
-                print(f"Eye-tracking data saved to {output_eye_file}")
-    
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
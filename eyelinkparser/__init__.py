@@ -3,23 +3,68 @@
 """
 This file is part of eyelinkparser.
 
+Submodules are imported on first access of one of their names, so importing
+the package does not load pandas and NumPy until they are needed.
 """
 
-from eyelinkparser._events import sample, fixation, saccade, blink
-from eyelinkparser._eyelinkparser import EyeLinkParser
-from eyelinkparser._trialprocessor import TrialProcessor
-from eyelinkparser._dataprocessor import DataProcessor
-__version__ = '0.17.5'
+import importlib
 
+# Manifests, sample caches and trial indexes record this version and are
+# only current while it matches, so bump it with every change to the
+# columns or format of the outputs
+__version__ = '0.18.1'
 
-def parse(parser=EyeLinkParser, **kwdict):
+# Public name -> submodule that defines it
+_EXPORTS = {
+    'sample': '_events', 'fixation': '_events', 'saccade': '_events', 'blink': '_events',
+    'EyeLinkParser': '_eyelinkparser',
+    'NodeLocator': '_nodes',
+    'ColumnarRows': '_columns',
+    'analyze_tree': '_trees', 'TreeAnalysis': '_trees',
+    'bootstrap': '_bootstrap', 'bootstrap_difference': '_bootstrap',
+    'TrialProcessor': '_trialprocessor',
+    'JSONSerializer': '_jsonio', 'JSON_MODES': '_jsonio',
+    'DataProcessor': '_dataprocessor',
+    'Manifest': '_manifest', 'file_digest': '_manifest',
+    'RunReport': '_instrument', 'Stage': '_instrument', 'peak_rss': '_instrument',
+    'write_eye_data': '_storage', 'read_eye_data': '_storage', 'eye_data_path': '_storage', 'FORMATS': '_storage',
+    'SampleCache': '_cache', 'load_samples': '_cache',
+    'TrialIndex': '_trialindex', 'load_trial_index': '_trialindex',
+    'Corpus': '_corpus', 'build_corpus': '_corpus',
+    'trial_features': '_features', 'corpus_features': '_features',
+    'EventIntervals': '_intervals', 'OffsetTimeline': '_intervals', 'assign_intervals': '_intervals',
+}
 
+__all__ = list(_EXPORTS) + ['parse', 'trial_processor', 'data_processor']
+
+
+def __getattr__(name):
+    module = _EXPORTS.get(name)
+    if module is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f'{__name__}.{module}'), name)
+    globals()[name] = value  # later lookups skip __getattr__
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_EXPORTS))
+
+
+def parse(parser=None, **kwdict):
+
+    if parser is None:
+        parser = __getattr__('EyeLinkParser')
     return parser(**kwdict).dm
 
-def trial_processor(processor=TrialProcessor, **kwdict):
+def trial_processor(processor=None, **kwdict):
 
+    if processor is None:
+        processor = __getattr__('TrialProcessor')
     return processor(**kwdict)
 
-def data_processor(processor=DataProcessor, **kwdict):
+def data_processor(processor=None, **kwdict):
 
-    return processor(**kwdict)
\ No newline at end of file
+    if processor is None:
+        processor = __getattr__('DataProcessor')
+    return processor(**kwdict)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+STATISTICS = ('mean', 'median', 'std', 'var')
+# Statistics that can be computed from per-cluster sums when resampling clusters
+CLUSTER_STATISTICS = ('mean', 'std', 'var')
+
+# Memory budget of the resampled values of one block
+BLOCK_BYTES = 64 * 1024 ** 2
+
+
+def bootstrap(data, columns, statistics=('mean',), n_bootstrap=10000, seed=None,
+              strata=None, cluster=None, n_jobs=1, block_bytes=BLOCK_BYTES):
+    """
+    Bootstrap distributions of statistics of one or more columns.
+
+    Resample indices are drawn as one integer matrix per block of
+    resamples, and statistics are computed over the whole block at once.
+    Blocks are sized to keep the resampled values within block_bytes and
+    can run in n_jobs threads. Every block has its own random stream
+    spawned from seed, so results do not depend on n_jobs.
+
+    Rows are resampled with replacement, within every stratum of the column
+    strata if given. With cluster (e.g. 'wid') whole clusters are resampled
+    instead, and statistics come from per-cluster sums. Missing values are
+    ignored, as in pandas. Returns a DataFrame with one row per resample
+    and a (column, statistic) column for every combination.
+    """
+    if isinstance(columns, str):
+        columns = [columns]
+    if isinstance(statistics, str):
+        statistics = [statistics]
+    for statistic in statistics:
+        if statistic not in STATISTICS:
+            raise ValueError(f"Unknown statistic: {statistic}")
+    if strata is not None and cluster is not None:
+        raise ValueError("Resample either within strata or by cluster, not both")
+    values = data[list(columns)].to_numpy(dtype=float)
+    if cluster is not None:
+        for statistic in statistics:
+            if statistic not in CLUSTER_STATISTICS:
+                raise ValueError(f"{statistic} cannot be computed by cluster")
+        resampler = _ClusterResampler(values, data[cluster].to_numpy(), statistics)
+    else:
+        groups = None if strata is None else data.groupby(strata, sort=False).indices.values()
+        resampler = _RowResampler(values, groups, statistics)
+    block_size = max(1, block_bytes // max(1, resampler.bytes_per_resample))
+    sizes = [min(block_size, n_bootstrap - start) for start in range(0, n_bootstrap, block_size)]
+    if not isinstance(seed, np.random.SeedSequence):
+        seed = np.random.SeedSequence(seed)
+    seeds = seed.spawn(len(sizes))
+    tasks = [(np.random.default_rng(block_seed), size) for block_seed, size in zip(seeds, sizes)]
+    if n_jobs > 1 and len(tasks) > 1:
+        with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+            blocks = list(executor.map(lambda task: resampler.block(*task), tasks))
+    else:
+        blocks = [resampler.block(*task) for task in tasks]
+    result = np.concatenate(blocks) if blocks else np.empty((0, len(columns) * len(statistics)))
+    index = pd.MultiIndex.from_product([columns, statistics], names=['column', 'statistic'])
+    return pd.DataFrame(result, columns=index)
+
+
+def bootstrap_difference(data1, data2, columns, statistics=('mean',), seed=None, **kwargs):
+    """
+    Bootstrap distribution of the difference of statistics between two
+    datasets, data2 minus data1. The share of positive differences is the
+    estimated power of testing whether data2 is greater than data1.
+    """
+    seed1, seed2 = np.random.SeedSequence(seed).spawn(2)
+    return (bootstrap(data2, columns, statistics, seed=seed2, **kwargs) -
+            bootstrap(data1, columns, statistics, seed=seed1, **kwargs))
+
+
+class _RowResampler:
+
+    def __init__(self, values, groups, statistics):
+        self.values = values
+        self.groups = None if groups is None else [np.asarray(group) for group in groups]
+        self.statistics = statistics
+        self.bytes_per_resample = values.size * 8 + len(values) * 8
+
+    def indices(self, rng, size):
+        n = len(self.values)
+        if self.groups is None:
+            return rng.integers(0, n, size=(size, n))
+        return np.concatenate([group[rng.integers(0, len(group), size=(size, len(group)))]
+                               for group in self.groups], axis=1)
+
+    def block(self, rng, size):
+        indices = self.indices(rng, size)
+        result = np.empty((size, self.values.shape[1] * len(self.statistics)))
+        i = 0
+        for column in self.values.T:
+            sample = column[indices]
+            for statistic in self.statistics:
+                result[:, i] = _statistic(sample, statistic)
+                i += 1
+        return result
+
+
+class _ClusterResampler:
+
+    def __init__(self, values, clusters, statistics):
+        codes, uniques = pd.factorize(clusters)
+        n_clusters = len(uniques)
+        present = ~np.isnan(values)
+        filled = np.where(present, values, 0.)
+        # Per cluster and column: number of values, their sum and sum of squares
+        self.counts = np.stack([np.bincount(codes, weights=column, minlength=n_clusters) for column in present.T], 1)
+        self.sums = np.stack([np.bincount(codes, weights=column, minlength=n_clusters) for column in filled.T], 1)
+        self.squares = np.stack([np.bincount(codes, weights=column ** 2, minlength=n_clusters) for column in filled.T], 1)
+        self.statistics = statistics
+        self.bytes_per_resample = n_clusters * 8 * (1 + 3 * values.shape[1])
+
+    def block(self, rng, size):
+        n_clusters = len(self.counts)
+        indices = rng.integers(0, n_clusters, size=(size, n_clusters))
+        counts = self.counts[indices].sum(axis=1)
+        sums = self.sums[indices].sum(axis=1)
+        squares = self.squares[indices].sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+            variances = (squares - sums * means) / (counts - 1)
+        variances[counts < 2] = np.nan
+        result = np.empty((size, counts.shape[1] * len(self.statistics)))
+        i = 0
+        for j in range(counts.shape[1]):
+            for statistic in self.statistics:
+                result[:, i] = (means[:, j] if statistic == 'mean' else
+                                variances[:, j] if statistic == 'var' else np.sqrt(variances[:, j]))
+                i += 1
+        return result
+
+
+def _statistic(sample, statistic):
+    """ A statistic of every row of a block of resampled values, ignoring NaN. """
+    missing = np.isnan(sample)
+    if not missing.any():
+        if statistic == 'mean':
+            return sample.mean(axis=1)
+        if statistic == 'median':
+            return np.median(sample, axis=1)
+        return getattr(sample, statistic)(axis=1, ddof=1)
+    counts = len(sample[0]) - missing.sum(axis=1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if statistic == 'median':
+            # Missing values sort last, so the median lies within the first counts values
+            ordered = np.sort(np.where(missing, np.inf, sample), axis=1)
+            rows = np.arange(len(sample))
+            median = (ordered[rows, np.maximum(counts - 1, 0) // 2] + ordered[rows, counts // 2 - (counts == 0)]) / 2
+            return np.where(counts > 0, median, np.nan)
+        filled = np.where(missing, 0., sample)
+        means = filled.sum(axis=1) / counts
+        if statistic == 'mean':
+            return means
+        variances = np.where(missing, 0., (sample - means[:, None]) ** 2).sum(axis=1) / (counts - 1)
+        variances[counts < 2] = np.nan
+        return variances if statistic == 'var' else np.sqrt(variances)
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from eyelinkparser._columns import COLUMNS
+from eyelinkparser._eyelinkparser import EyeLinkParser
+from eyelinkparser._manifest import Manifest, parser_version, write_json
+from eyelinkparser._storage import INT_COLUMNS, STRING_COLUMNS, _trial_list
+
+# Bumped whenever the layout of the cache files changes
+CACHE_VERSION = 3
+
+# Cache file -> (eye data column, dtype) of the Gaze rows
+GAZE_COLUMNS = {
+    'time': ('Time', np.float64),
+    'x': ('X', np.float64),
+    'y': ('Y', np.float64),
+    'node': ('Node', np.int8),
+    'trial_index': ('trial_index', np.int32),
+    'visit': ('visit', np.int16),
+    'switch': ('switch', np.int16),
+    'event': ('event', np.int32),  # codes into the 'events' list of meta.json, -1 if none
+}
+
+class SampleCache:
+    """
+    Parsed eye data of one samples.asc, stored next to it in
+    <samples.asc>.cache/ so it does not have to be parsed again. The Gaze
+    rows are kept as one .npy file per column (time, x, y, node,
+    trial_index, visit, switch, event), which load() memory-maps; all other
+    rows (messages, fixations, saccades, blinks) are kept in a small event
+    table, with their position in the parsed frame so to_frame() can
+    restore the original row order.
+
+    manifest.json records the ASC file in a Manifest, with the parser and
+    cache versions; the cache is only used while it is current there.
+    meta.json describes the cached data.
+    """
+
+    SUFFIX = '.cache'
+    META_FILE = 'meta.json'
+    MANIFEST_FILE = 'manifest.json'
+    EVENTS_FILE = 'events.npz'
+
+    def __init__(self, asc_path):
+        self.asc_path = asc_path
+        self.path = asc_path + self.SUFFIX
+        self.meta = None
+        self.columns = {}
+        self._events = None
+
+    def is_current(self):
+        """ True if the cache was built from the current content of the ASC file, see Manifest.is_current. """
+        manifest = Manifest(os.path.join(self.path, self.MANIFEST_FILE))
+        source = os.path.abspath(self.asc_path)
+        mtime_ns = manifest.entries.get(source, {}).get('mtime_ns')
+        if not manifest.is_current(source, os.path.abspath(self.path), self._version()):
+            return False
+        if manifest.entries[source]['mtime_ns'] != mtime_ns:
+            manifest.save()  # keeps the refreshed mtime of a touched but unchanged file
+        return True
+
+    def build(self, engine='token', asc_encoding='ISO-8859-1'):
+        """ Parses the ASC file and (re)writes the cache. Returns self, loaded. """
+        parser = EyeLinkParser(eye_folder=os.path.dirname(self.asc_path), asc_encoding=asc_encoding, columnar=True)
+        frame = parser.parse_asc_file(self.asc_path, engine=engine, reader='mmap')
+        is_gaze = (frame['Type'] == 'Gaze').to_numpy() if len(frame) else np.zeros(0, dtype=bool)
+        gaze = frame.loc[is_gaze]
+        event_codes, events = pd.factorize(gaze['event'].astype(object)) if len(gaze) else (np.zeros(0), [])
+
+        tmp_path = self.path + '.tmp'
+        if os.path.isdir(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+        for name, (column, dtype) in GAZE_COLUMNS.items():
+            values = event_codes if name == 'event' else gaze[column].to_numpy() if len(gaze) else np.zeros(0)
+            np.save(os.path.join(tmp_path, name + '.npy'), np.asarray(values).astype(dtype))
+        others = frame.loc[~is_gaze]
+        table = {'__position__': np.flatnonzero(~is_gaze)}
+        for column in others.columns:
+            values = others[column]
+            if column in STRING_COLUMNS:
+                values = values.astype(object)
+                table[column] = values.where(values.notna(), '').to_numpy().astype(str)
+            elif pd.api.types.is_integer_dtype(values):
+                table[column] = values.to_numpy(dtype=np.int64)
+            else:
+                table[column] = values.to_numpy(dtype=float)
+        np.savez(os.path.join(tmp_path, self.EVENTS_FILE), **table)
+        meta = {
+            'source': os.path.basename(self.asc_path),
+            'engine': engine,
+            'n_samples': int(is_gaze.sum()),
+            'n_events': len(others),
+            'events': [str(event) for event in events],
+        }
+        write_json(os.path.join(tmp_path, self.META_FILE), meta)
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        os.rename(tmp_path, self.path)
+        manifest = Manifest(os.path.join(self.path, self.MANIFEST_FILE))
+        manifest.record(os.path.abspath(self.asc_path), os.path.abspath(self.path), self._version())
+        manifest.save()
+        return self.load()
+
+    def load(self, mmap=True):
+        """
+        Opens the cache. The sample columns are memory-mapped read-only
+        unless mmap=False, so loading costs no parsing and no copying.
+        """
+        self.meta = self._read_meta()
+        if self.meta is None:
+            raise FileNotFoundError(f"No sample cache at {self.path}")
+        mode = 'r' if mmap else None
+        self.columns = {name: np.load(os.path.join(self.path, name + '.npy'), mmap_mode=mode)
+                        for name in GAZE_COLUMNS}
+        self._events = None
+        return self
+
+    def __len__(self):
+        return self.meta['n_samples'] if self.meta else 0
+
+    @property
+    def events(self):
+        """ The rows other than Gaze, as eye data with a __position__ column. """
+        if self._events is None:
+            with np.load(os.path.join(self.path, self.EVENTS_FILE)) as table:
+                events = pd.DataFrame({name: table[name] for name in table.files})
+            for column in STRING_COLUMNS:
+                if column in events:
+                    events[column] = events[column].replace('', np.nan)
+            self._events = events
+        return self._events
+
+    def samples(self, trial_index=None):
+        """
+        The Gaze rows as eye data, optionally only of some trials. For all
+        trials or consecutive ones the numeric columns are views of the
+        memory-mapped files, not copies.
+        """
+        return self._gaze_frame(self._gaze_rows(trial_index))
+
+    def to_frame(self, columns=None, types=None, trial_index=None):
+        """
+        The parsed eye data, like read_eye_data: all COLUMNS, or only the
+        given columns, row Types and trials, in the order they were parsed,
+        with the dtypes read_eye_data gives the CSV output.
+        """
+        if isinstance(types, str):
+            types = [types]
+        frames, positions = [], []
+        if types is None or 'Gaze' in types:
+            selected = self._gaze_rows(trial_index)
+            frames.append(self._gaze_frame(selected))
+            positions.append(self._gaze_positions()[selected])
+        events = self.events
+        if len(events):
+            keep = self._select(events['trial_index'].to_numpy(), trial_index)
+            if types is not None:
+                keep &= events['Type'].isin(types).to_numpy()
+            frames.append(events.loc[keep].drop(columns='__position__'))
+            positions.append(events['__position__'].to_numpy()[keep])
+        df = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
+        if positions:
+            df = df.iloc[np.argsort(np.concatenate(positions), kind='stable')].reset_index(drop=True)
+        df = df.reindex(columns=list(COLUMNS))
+        df = df.astype({name: 'int64' if name in INT_COLUMNS else 'float64'
+                        for name in COLUMNS if name not in STRING_COLUMNS})
+        if columns is not None:
+            df = df[list(columns)]
+        return df
+
+    def _gaze_rows(self, trial_index):
+        """
+        The Gaze rows of the given trials, or of all trials for None. The
+        parser only ever counts trials up, so samples are sorted by
+        trial_index and every trial is found by binary search. Consecutive
+        trials make one slice; other selections are positions.
+        """
+        if trial_index is None:
+            return slice(None)
+        trials = self.columns['trial_index']
+        wanted = np.unique(_trial_list(trial_index))
+        starts = np.searchsorted(trials, wanted, side='left')
+        ends = np.searchsorted(trials, wanted, side='right')
+        found = starts < ends
+        starts, ends = starts[found], ends[found]
+        if not len(starts):
+            return slice(0, 0)
+        if np.array_equal(starts[1:], ends[:-1]):
+            return slice(int(starts[0]), int(ends[-1]))
+        return np.concatenate([np.arange(start, end) for start, end in zip(starts, ends)])
+
+    def _select(self, trials, trial_index):
+        if trial_index is None:
+            return np.ones(len(trials), dtype=bool)
+        return np.isin(trials, _trial_list(trial_index))
+
+    def _gaze_positions(self):
+        # Gaze rows fill the positions the event table does not take
+        n_rows = self.meta['n_samples'] + self.meta['n_events']
+        is_gaze = np.ones(n_rows, dtype=bool)
+        is_gaze[self.events['__position__'].to_numpy()] = False
+        return np.flatnonzero(is_gaze)
+
+    def _gaze_frame(self, rows):
+        """ The Gaze rows at rows, a slice or positions, as eye data; slices of the columns are not copied. """
+        frame = {}
+        for name, (column, dtype) in GAZE_COLUMNS.items():
+            values = self.columns[name][rows]
+            if name == 'event':
+                events = np.array(self.meta['events'] + [np.nan], dtype=object)
+                values = events[values]  # code -1 picks the trailing NaN
+            frame[column] = values
+        n_rows = len(frame['Time'])
+        return pd.DataFrame({'Type': np.full(n_rows, 'Gaze', dtype=object), **frame}, copy=False)
+
+    def _version(self):
+        return f'{parser_version()} cache={CACHE_VERSION}'
+
+    def _read_meta(self):
+        meta_path = os.path.join(self.path, self.META_FILE)
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path) as file:
+            return json.load(file)
+
+
+def load_samples(asc_path, engine='token', mmap=True):
+    """
+    The SampleCache of an ASC file, loaded; it is built first if it is
+    missing or out of date.
+    """
+    cache = SampleCache(asc_path)
+    if not cache.is_current():
+        return cache.build(engine=engine)
+    return cache.load(mmap=mmap)
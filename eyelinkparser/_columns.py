@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+from array import array
+import numpy as np
+import pandas as pd
+
+# Columns of each row type, in the order EyeLinkParser has always emitted
+# them. The 'Type' column comes first and is implied by the row type.
+SCHEMAS = {
+    'Message': (
+        ('Event', 'category'), ('Visit', 'int'), ('Switch', 'int'), ('Time', 'float'),
+        ('TimeEvent', 'float'), ('Offset', 'float'), ('trial_index', 'int')),
+    'Fixation': (
+        ('Start', 'float'), ('End', 'float'), ('Duration', 'float'), ('Node', 'int'),
+        ('X', 'float'), ('Y', 'float'), ('Pupil', 'float'), ('trial_index', 'int'),
+        ('event', 'category'), ('visit', 'int'), ('switch', 'int')),
+    'Gaze': (
+        ('Time', 'float'), ('Node', 'int'), ('X', 'float'), ('Y', 'float'),
+        ('trial_index', 'int'), ('event', 'category'), ('visit', 'int'), ('switch', 'int')),
+    'Blink': (
+        ('Start', 'float'), ('End', 'float'), ('Duration', 'float'),
+        ('trial_index', 'int'), ('event', 'category'), ('visit', 'int'), ('switch', 'int')),
+    'Saccade': (
+        ('Eye', 'category'), ('Start', 'float'), ('End', 'float'), ('Duration', 'float'),
+        ('Start_X', 'float'), ('Start_Y', 'float'), ('End_X', 'float'), ('End_Y', 'float'),
+        ('Amplitude', 'float'), ('Peak_Velocity', 'float'), ('Start_Node', 'int'),
+        ('End_Node', 'int'), ('trial_index', 'int'), ('event', 'category'),
+        ('visit', 'int'), ('switch', 'int')),
+    # Gaze aggregated to time bins per node, see EyeLinkParser(gaze='bin'): Time
+    # is the start of the bin, X and Y the means of its Count samples
+    'GazeBin': (
+        ('Time', 'float'), ('Node', 'int'), ('X', 'float'), ('Y', 'float'), ('Count', 'int'),
+        ('trial_index', 'int'), ('event', 'category'), ('visit', 'int'), ('switch', 'int')),
+}
+
+ROW_KEYS = {kind: ('Type',) + tuple(name for name, _ in schema) for kind, schema in SCHEMAS.items()}
+
+# Every column any row type can have, for outputs that need a fixed layout
+COLUMNS = tuple(dict.fromkeys(name for keys in ROW_KEYS.values() for name in keys))
+
+_DTYPES = {'float': np.float64, 'int': np.int64, 'category': np.int32}
+
+
+class ColumnarRows:
+    """
+    Accumulates parsed rows per row type in typed NumPy columns instead of
+    one dict per row. Rows are buffered as tuples and converted to column
+    chunks every chunk_size rows, so memory stays close to the size of the
+    final frame. String columns are stored as category codes.
+    """
+
+    CHUNK_SIZE = 65536
+
+    def __init__(self, schemas=SCHEMAS, chunk_size=None):
+        self.schemas = schemas
+        self.chunk_size = chunk_size or self.CHUNK_SIZE
+        self._codes = {}  # row type -> code, in order of first appearance
+        self._categories = {}  # column name -> {value: code}
+        self.clear()
+
+    def clear(self):
+        """ Drops all rows; category codes are kept so chunks stay comparable. """
+        self._order = array('B')  # row type code of every row, in parse order
+        self._buffers = {}
+        self._chunks = {}
+
+    def __len__(self):
+        return len(self._order)
+
+    def append(self, kind, values):
+        """ Appends one row of the given type; values follow SCHEMAS[kind]. """
+        buffer = self._buffers.get(kind)
+        if buffer is None:
+            buffer = self._start(kind)
+        buffer.append(values)
+        self._order.append(self._codes[kind])
+        if len(buffer) >= self.chunk_size:
+            self._flush(kind)
+
+    def extend(self, kind, columns):
+        """ Appends many rows of one type as columns; scalars apply to every row. """
+        if kind not in self._buffers:
+            self._start(kind)
+        self._flush(kind)
+        n = max(len(column) for column in columns if isinstance(column, np.ndarray))
+        chunk = []
+        for (name, dtype), column in zip(self.schemas[kind], columns):
+            if isinstance(column, np.ndarray):
+                chunk.append(self._column(name, dtype, column))
+            elif dtype == 'category':
+                categories = self._categories.setdefault(name, {})
+                chunk.append(np.full(n, categories.setdefault(column, len(categories)), dtype=np.int32))
+            else:
+                chunk.append(np.full(n, column, dtype=_DTYPES[dtype]))
+        self._chunks[kind].append(chunk)
+        self._order.extend(bytes([self._codes[kind]]) * n)
+
+    def _start(self, kind):
+        if kind not in self._codes:
+            self._codes[kind] = len(self._codes)
+        self._chunks[kind] = []
+        buffer = self._buffers[kind] = []
+        return buffer
+
+    def _flush(self, kind):
+        buffer = self._buffers[kind]
+        if not buffer:
+            return
+        columns = [self._column(name, dtype, values)
+                   for (name, dtype), values in zip(self.schemas[kind], zip(*buffer))]
+        self._chunks[kind].append(columns)
+        buffer.clear()
+
+    def _column(self, name, dtype, values):
+        if dtype == 'category':
+            categories = self._categories.setdefault(name, {})
+            return np.array([categories.setdefault(value, len(categories)) for value in values],
+                            dtype=np.int32)
+        return np.asarray(values, dtype=_DTYPES[dtype])
+
+    def _columns(self, kind):
+        self._flush(kind)
+        chunks = self._chunks[kind]
+        return [np.concatenate([chunk[i] for chunk in chunks])
+                for i in range(len(self.schemas[kind]))]
+
+    def _categorical(self, name, codes, categorical):
+        """ Category codes (-1 for missing) to a Categorical or object array. """
+        values = list(self._categories.get(name, ()))
+        if categorical:
+            # None is kept as a value internally but is missing in a Categorical
+            remap = np.full(len(values) + 1, -1, dtype=np.int32)
+            kept = []
+            for i, value in enumerate(values):
+                if value is not None:
+                    remap[i] = len(kept)
+                    kept.append(value)
+            return pd.Categorical.from_codes(remap[codes], kept)
+        lookup = np.empty(len(values) + 1, dtype=object)
+        lookup[:-1] = values
+        lookup[-1] = np.nan
+        return lookup[codes]
+
+    def _type_column(self, kind, n, categorical):
+        if categorical:
+            return pd.Categorical.from_codes(np.zeros(n, dtype=np.int8), [kind])
+        return np.full(n, kind, dtype=object)
+
+    def to_frames(self, categorical=True):
+        """ One DataFrame per row type, keyed by type. """
+        frames = {}
+        for kind in self._present():
+            columns = self._columns(kind)
+            n = len(columns[0])
+            data = {'Type': self._type_column(kind, n, categorical)}
+            for (name, dtype), column in zip(self.schemas[kind], columns):
+                data[name] = self._categorical(name, column, categorical) if dtype == 'category' else column
+            frames[kind] = pd.DataFrame(data)
+        return frames
+
+    def to_frame(self, categorical=True):
+        """
+        All rows in parse order as one DataFrame, with the same columns and
+        dtypes as building it from a list of row dicts. Columns that only
+        some row types have are NaN elsewhere, so their ints become floats.
+
+        Every column is filled straight from the chunks of each row type at
+        that type's positions. The float columns share one preallocated
+        block that becomes the frame without being copied, so memory peaks
+        at about the chunks plus the frame.
+        """
+        n = len(self._order)
+        if not n:
+            return pd.DataFrame()
+        kinds = self._present()
+        order = np.frombuffer(self._order, dtype=np.uint8)
+        positions = {kind: np.flatnonzero(order == self._codes[kind]) for kind in kinds}
+        types = list(self._codes)
+        layout = {}
+        for kind in kinds:
+            self._flush(kind)
+            for i, (name, dtype) in enumerate(self.schemas[kind]):
+                layout.setdefault(name, (dtype, []))[1].append((kind, i))
+        floats = [name for name, (dtype, sources) in layout.items()
+                  if dtype == 'float' or (dtype == 'int' and len(sources) < len(kinds))]
+        block = np.empty((len(floats), n))
+        others = {'Type': pd.Categorical.from_codes(order, types) if categorical else
+                  np.array(types, dtype=object)[order]}
+        for name, (dtype, sources) in layout.items():
+            complete = len(sources) == len(kinds)
+            if dtype == 'category':
+                column = np.full(n, -1, dtype=np.int32)
+            elif name in floats:
+                column = block[floats.index(name)]
+                if not complete:
+                    column.fill(np.nan)
+            else:
+                column = np.empty(n, dtype=np.int64)
+            for kind, i in sources:
+                self._fill(column, positions[kind], kind, i)
+            if dtype == 'category':
+                others[name] = self._categorical(name, column, categorical)
+            elif name not in floats:
+                others[name] = column
+        frame = pd.DataFrame(block.T, columns=floats, copy=False)
+        for loc, name in enumerate(['Type'] + list(layout)):
+            if name in others:
+                frame.insert(loc, name, others.pop(name))
+        return frame
+
+    def _fill(self, column, positions, kind, i):
+        """ Writes column i of every chunk of a row type at its positions. """
+        start = 0
+        for chunk in self._chunks[kind]:
+            values = chunk[i]
+            column[positions[start:start + len(values)]] = values
+            start += len(values)
+
+    def _present(self):
+        """ Row types present, in order of their first row. """
+        order = np.frombuffer(self._order, dtype=np.uint8)
+        codes, first = np.unique(order, return_index=True)
+        types = list(self._codes)
+        return [types[code] for code in codes[np.argsort(first)]]
@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+
+import glob
+import json
+import os
+import shutil
+from urllib.parse import quote
+import pandas as pd
+from eyelinkparser._jsonio import JSONSerializer
+from eyelinkparser._manifest import write_json
+from eyelinkparser._storage import _pyarrow, _trial_list
+
+INDEX_COLUMNS = ['wid', 'trial_index']
+
+
+class Corpus:
+    """
+    Processed trial data of many participants in one parquet dataset,
+    partitioned by wid and sorted by trial_index within a participant.
+    Participants can be added or replaced one at a time. Columns holding
+    lists or dicts (graph, rewards, events, ...) are stored as JSON strings
+    and decoded when they are loaded.
+
+    The column types and the source of every participant are kept in
+    _corpus.json in the dataset directory.
+    """
+
+    INFO_FILE = '_corpus.json'
+
+    def __init__(self, path):
+        self.path = path
+        self.info = {'columns': {}, 'wids': {}}
+        info_path = os.path.join(path, self.INFO_FILE)
+        if os.path.exists(info_path):
+            with open(info_path) as file:
+                self.info = json.load(file)
+        self.serializer = JSONSerializer()
+
+    @property
+    def wids(self):
+        return list(self.info['wids'])
+
+    def __len__(self):
+        return sum(entry['n_trials'] for entry in self.info['wids'].values())
+
+    def is_current(self, trial_path, wid=None):
+        """ True if the participant was added from this file and it has not changed since. """
+        wid = wid or _wid(trial_path)
+        entry = self.info['wids'].get(wid)
+        if entry is None or entry['source'] != os.path.abspath(trial_path):
+            return False
+        stat = os.stat(trial_path)
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def add(self, trial_path, wid=None):
+        """
+        Adds a participant's processed trial file (.json or .jsonl),
+        replacing the participant if it is already in the corpus. Returns
+        the number of trials added.
+        """
+        wid = wid or _wid(trial_path)
+        trials = pd.DataFrame(self.serializer.load(trial_path))
+        trials = trials.drop(columns='wid', errors='ignore')
+        if 'trial_index' in trials:
+            trials = trials.sort_values('trial_index', kind='stable', ignore_index=True)
+        pa = _pyarrow()
+        columns = self.info['columns']
+        for name in trials.columns:
+            if name not in columns:
+                columns[name] = _column_type(trials[name])
+        table = pa.Table.from_pandas(self._encode(trials), schema=self._schema(pa, trials.columns),
+                                     preserve_index=False)
+        partition = os.path.join(self.path, 'wid=' + quote(wid, safe=''))
+        if os.path.isdir(partition):
+            shutil.rmtree(partition)
+        os.makedirs(partition)
+        pa.parquet.write_table(table, os.path.join(partition, 'part-0.parquet'), compression='zstd')
+        stat = os.stat(trial_path)
+        self.info['wids'][wid] = {
+            'source': os.path.abspath(trial_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'n_trials': len(trials),
+        }
+        self.save()
+        return len(trials)
+
+    def remove(self, wid):
+        partition = os.path.join(self.path, 'wid=' + quote(wid, safe=''))
+        if os.path.isdir(partition):
+            shutil.rmtree(partition)
+        self.info['wids'].pop(wid, None)
+        self.save()
+
+    def save(self):
+        """ Writes _corpus.json atomically. """
+        write_json(os.path.join(self.path, self.INFO_FILE), self.info)
+
+    def load(self, columns=None, wid=None, trial_index=None, index=True):
+        """
+        Loads the corpus, or only the given columns, participants and
+        trials. Only the selected columns and partitions are read. With
+        index=True the frame is indexed by (wid, trial_index).
+        """
+        pa = _pyarrow()
+        if isinstance(wid, str):
+            wid = [wid]
+        trial_index = _trial_list(trial_index)
+        names = ['wid'] + list(self.info['columns']) if columns is None else list(columns)
+        read_columns = list(dict.fromkeys((INDEX_COLUMNS if index else []) + names))
+        if self.wids:
+            schema = self._schema(pa, self.info['columns']).append(pa.field('wid', pa.string()))
+            partitioning = pa.dataset.partitioning(pa.schema([('wid', pa.string())]), flavor='hive')
+            dataset = pa.dataset.dataset(self.path, format='parquet', schema=schema, partitioning=partitioning)
+            expression = None
+            if wid is not None:
+                expression = pa.dataset.field('wid').isin(list(wid))
+            if trial_index is not None:
+                condition = pa.dataset.field('trial_index').isin(trial_index)
+                expression = condition if expression is None else expression & condition
+            df = self._decode(dataset.to_table(columns=read_columns, filter=expression).to_pandas())
+        else:
+            df = pd.DataFrame(columns=read_columns)
+        if index:
+            df = df.set_index(INDEX_COLUMNS).sort_index(kind='stable')
+            df = df[[name for name in names if name not in INDEX_COLUMNS]]
+        return df
+
+    def _schema(self, pa, names):
+        types = {'int': pa.int64(), 'float': pa.float64(), 'string': pa.string(),
+                 'json': pa.string(), 'bool': pa.bool_()}
+        return pa.schema([(name, types[self.info['columns'][name]]) for name in names])
+
+    def _encode(self, trials):
+        trials = trials.copy()
+        for name in trials.columns:
+            kind = self.info['columns'][name]
+            if kind == 'json':
+                trials[name] = [self.serializer.dumps(value).decode('utf-8') for value in trials[name]]
+            elif kind == 'int' and trials[name].isna().any():
+                raise ValueError(f"Column {name} has missing values")
+        return trials
+
+    def _decode(self, df):
+        for name in df.columns:
+            if self.info['columns'].get(name) == 'json':
+                df[name] = [None if value is None else self.serializer.loads(value) for value in df[name]]
+        return df
+
+
+def _wid(trial_path):
+    return os.path.basename(trial_path).split('.')[0]
+
+
+def _column_type(column):
+    """ Storage type of a column of processed trial data. """
+    if column.name == 'trial_index':
+        return 'int'
+    values = column.dropna()
+    if not len(values):
+        return 'json'  # JSON holds whatever later participants put in it
+    if pd.api.types.is_bool_dtype(values):
+        return 'bool'
+    if pd.api.types.is_numeric_dtype(values):
+        return 'float'
+    if all(isinstance(value, str) for value in values):
+        return 'string'
+    return 'json'
+
+
+def build_corpus(trial_dir, path, force=False):
+    """
+    Adds every processed trial file in trial_dir to the corpus at path.
+    A participant with both a <wid>.json and a <wid>.jsonl, left by a
+    change of --json-mode, is added from the newer one. Participants whose
+    file has not changed since it was added are skipped unless force is
+    set. Returns the Corpus.
+    """
+    corpus = Corpus(path)
+    newest = {}
+    for trial_path in (glob.glob(os.path.join(trial_dir, '*.json')) +
+                       glob.glob(os.path.join(trial_dir, '*.jsonl'))):
+        wid = _wid(trial_path)
+        if wid not in newest or os.path.getmtime(trial_path) > os.path.getmtime(newest[wid]):
+            newest[wid] = trial_path
+    for wid, trial_path in sorted(newest.items()):
+        if force or not corpus.is_current(trial_path, wid):
+            corpus.add(trial_path, wid)
+    return corpus
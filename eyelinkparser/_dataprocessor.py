@@ -1,57 +1,162 @@
-import re
 import numpy as np
 import pandas as pd
-import math
-import json 
+from eyelinkparser._storage import read_eye_data
+from eyelinkparser._features import trial_features
+from eyelinkparser._intervals import assign_intervals
 
 class DataProcessor:
-    def __init__(self, trial_dir, eye_dir,output_dir=None):
+    # The eye data columns match() needs, for callers that want to load less
+    EYE_COLUMNS = ['Type', 'trial_index', 'visit', 'Node', 'Duration', 'Start_Node', 'End_Node', 'Count']
+    # Row Types of gaze: raw samples, or samples aggregated to time bins with a Count
+    GAZE_TYPES = ['Gaze', 'GazeBin']
+    TRIAL_COLUMNS = ['graph', 'rewards', 'start', 'choice', 'layer1', 'layer2', 'trial_index', 'difficulty', 'difficulty_1', 'difficulty_2', 'connect_nodes', 'non_connect_nodes','type', 'wid','accuracy',
+        'accuracy_1','df', 'RT_first_visit', 'RT_second_visit', 'RT', 'max_reward', 'loss']
+    VISITS = range(4)  # assuming maximum 3 visits per trial
+
+    def __init__(self, trial_dir, eye_dir,output_dir=None, eye_columns=None, eye_types=None):
         self.trial_data = self.read_trial_data(trial_dir)
-        self.eye_data = self.read_eye_data(eye_dir)
+        self.eye_data = self.read_eye_data(eye_dir, columns=eye_columns, types=eye_types)
         self.output_dir = output_dir
+        self._eye_index = None
+        self._summaries = None
 
     def read_trial_data(self, filepath):
-        """ Read trial data from a JSON file. """
+        """ Read trial data from a JSON file or a JSON lines file (.jsonl). """
         with open(filepath, 'r') as file:
-            return pd.read_json(file)
+            return pd.read_json(file, lines=filepath.endswith('.jsonl'))
     
-    def read_eye_data(self, filepath):
-        """ Read eye-tracking data from a CSV file. """
-        return pd.read_csv(filepath)
+    def read_eye_data(self, filepath, columns=None, types=None, trial_index=None):
+        """
+        Read eye-tracking data from a CSV file, a feather file, a parquet
+        directory or the sample cache of a samples.asc, optionally only some
+        columns, row Types and trials.
+        """
+        return read_eye_data(filepath, columns=columns, types=types, trial_index=trial_index)
     
     
+    def align_events(self, at='start', timeline=None):
+        """
+        Re-tags the eye data with the trial_index, event, visit and switch
+        of the trial data event interval every row falls in, instead of the
+        message state the parser kept, see assign_intervals. Needs the
+        events of the trial data and the Time, Start and End columns (and
+        Message rows for saccades) of the eye data. Returns the eye data.
+        """
+        self.eye_data = assign_intervals(self.eye_data, self.trial_data, timeline=timeline, at=at)
+        self._eye_index = None
+        self._summaries = None
+        return self.eye_data
+
+    def index_eye_data(self):
+        """
+        Groups the eye data rows once by (trial_index, visit, Type), so every
+        lookup only touches the rows of its own group.
+        """
+        if self._eye_index is None:
+            self._eye_index = self.eye_data.groupby(['trial_index', 'visit', 'Type'], sort=False).indices
+        return self._eye_index
+
+    def visit_eye_data(self, trial_index, visit, row_type):
+        """ The eye data rows of one Type during one visit of a trial. """
+        positions = self.index_eye_data().get((trial_index, visit, row_type))
+        if positions is None:
+            return self.eye_data.iloc[:0]
+        return self.eye_data.iloc[positions]
+
+    def visit_summaries(self):
+        """
+        Fixation, saccade and gaze summaries of every (trial_index, visit) at
+        once, as three dicts keyed by (trial_index, visit). Records are built
+        with one to_dict per row Type and split by group.
+        """
+        if self._summaries is None:
+            fixations = self._visit_records('Fixation', {'Node': 'node', 'Duration': 'duration'})
+            saccades = self._visit_records('Saccade', {'Start_Node': 'start_node', 'End_Node': 'end_node', 'Duration': 'duration'})
+            gaze_counts = {}
+            for (trial_index, visit, node), count in self._gaze_counts(self.eye_data, ['trial_index', 'visit', 'Node']).items():
+                gaze_counts.setdefault((trial_index, visit), self._empty_gaze_counts())[node] = count
+            self._summaries = fixations, saccades, gaze_counts
+        return self._summaries
+
+    def _visit_records(self, row_type, columns):
+        """
+        Records of the rows of one Type per (trial_index, visit), split by
+        the groups of index_eye_data. The rows are converted with one
+        to_dict, and every group picks its records by position.
+        """
+        positions = np.flatnonzero((self.eye_data['Type'] == row_type).to_numpy())
+        rows = self.eye_data.iloc[positions]
+        records = rows[list(columns)].rename(columns=columns).to_dict(orient='records')
+        record_of = np.full(len(self.eye_data), -1)
+        record_of[positions] = np.arange(len(positions))
+        return {(trial_index, visit): [records[i] for i in record_of[group]]
+                for (trial_index, visit, kind), group in self.index_eye_data().items() if kind == row_type}
+
+    def _gaze_counts(self, eye_data, keys):
+        """
+        Number of gaze samples per group of keys, from Gaze rows (one per
+        sample) and GazeBin rows (Count samples each) alike.
+        """
+        gaze_data = eye_data[eye_data['Type'].isin(self.GAZE_TYPES)]
+        samples = gaze_data['Count'].fillna(1) if 'Count' in gaze_data else pd.Series(1, index=gaze_data.index)
+        return samples.groupby([gaze_data[key] for key in keys]).sum().astype(int)
+
+    def _empty_gaze_counts(self):
+        return {node: 0 for node in range(-1, 10)}  # Adjust range as necessary
+
     def process_trial(self, trial_data, trial_index):
         """ Process a single trial's eye-tracking data. """
-        processed_trial_data = []
-        for visit in range(4):  # assuming maximum 3 visits per trial
-            visit_eye_data = self.eye_data[(self.eye_data['trial_index'] == trial_index) & (self.eye_data['visit'] == visit)]
-            fixation_data = self.process_fixation(visit_eye_data)
-            saccade_data = self.process_saccade(visit_eye_data)
-            gaze_data = self.count_gaze(visit_eye_data)
+        return self._process_trial(trial_data.to_dict(orient='records')[0], trial_index)
 
+    def _process_trial(self, trial_record, trial_index):
+        fixations, saccades, gaze_counts = self.visit_summaries()
+        processed_trial_data = []
+        for visit in self.VISITS:
+            key = (trial_index, visit)
             processed_trial = {
-                **trial_data.to_dict(orient='records')[0],
-                'fixation': fixation_data,
-                'saccade': saccade_data,
-                'gaze': gaze_data,
+                **trial_record,
+                'fixation': list(fixations.get(key, ())),
+                'saccade': list(saccades.get(key, ())),
+                'gaze': dict(gaze_counts.get(key) or self._empty_gaze_counts()),
                 'visit': visit,
             }
             processed_trial_data.append(processed_trial)
         return processed_trial_data
 
-    
-    def match(self):
-        """ Match the trial data with the eye-tracking data. """
+    def match(self, long=False):
+        """
+        Match the trial data with the eye-tracking data. Returns one dict per
+        trial and visit, or with long=True a long-format DataFrame instead.
+        """
+        if long:
+            return self.match_long()
         processed_data = []
-        for trial_index in self.trial_data['trial_index'].unique():
-            trial_data = self.trial_data[self.trial_data['trial_index'] == trial_index]
-            trial_data_filtered = trial_data[['graph', 'rewards', 'start', 'choice', 'layer1', 'layer2', 'trial_index', 'difficulty', 'difficulty_1', 'difficulty_2', 'connect_nodes', 'non_connect_nodes','type', 'wid','accuracy',
-                'accuracy_1','df', 'RT_first_visit', 'RT_second_visit', 'RT', 'max_reward', 'loss']]
-
+        trials = self.trial_data.drop_duplicates('trial_index')[self.TRIAL_COLUMNS]
+        for trial_record in trials.to_dict(orient='records'):
+            processed_data.extend(self._process_trial(trial_record, trial_record['trial_index']))
+        return processed_data
 
-            processed_data.extend(self.process_trial(trial_data_filtered, trial_index))
+    def match_long(self):
+        """
+        The per-visit summaries of match() as one long DataFrame keyed by
+        trial_index and visit, with one row per fixation, per saccade and per
+        gazed node (kind 'fixation', 'saccade' or 'gaze').
+        """
+        eye_data = self.eye_data[self.eye_data['trial_index'].isin(self.trial_data['trial_index']) &
+                                 self.eye_data['visit'].isin(self.VISITS)]
+        fixations = eye_data.loc[eye_data['Type'] == 'Fixation', ['trial_index', 'visit', 'Node', 'Duration']]
+        fixations = fixations.rename(columns={'Node': 'node', 'Duration': 'duration'}).assign(kind='fixation')
+        saccades = eye_data.loc[eye_data['Type'] == 'Saccade', ['trial_index', 'visit', 'Start_Node', 'End_Node', 'Duration']]
+        saccades = saccades.rename(columns={'Start_Node': 'start_node', 'End_Node': 'end_node', 'Duration': 'duration'}).assign(kind='saccade')
+        gaze = self._gaze_counts(eye_data, ['trial_index', 'visit', 'Node'])
+        gaze = gaze.reset_index(name='count').rename(columns={'Node': 'node'}).assign(kind='gaze')
+        long_data = pd.concat([fixations, saccades, gaze], ignore_index=True)
+        long_data = long_data.sort_values(['trial_index', 'visit'], kind='stable', ignore_index=True)
+        return long_data[['trial_index', 'visit', 'kind', 'node', 'start_node', 'end_node', 'duration', 'count']]
 
-        return processed_data
+    def features(self, by_visit=False):
+        """ Per-trial (or per-visit) gaze features, see trial_features. """
+        return trial_features(self.trial_data, self.eye_data, by_visit=by_visit)
 
     def process_fixation(self, eye_data):
         """ Process fixation data. """
@@ -59,9 +164,8 @@ class DataProcessor:
         return [{'node': row['Node'], 'duration': row['Duration']} for index, row in fixations.iterrows()]
 
     def count_gaze(self, eye_data):
-        """ Count the number of gaze events for each node. """
-        gaze_data = eye_data[eye_data['Type'] == 'Gaze']
-        node_counts = gaze_data.groupby('Node').size()
+        """ Count the number of gaze events for each node, from Gaze or binned GazeBin rows. """
+        node_counts = self._gaze_counts(eye_data, ['Node'])
         
         # Initialize a dictionary to hold counts for all nodes, defaulting to 0
         all_node_counts = {node: 0 for node in range(-1, 10)}  # Adjust range as necessary
@@ -3,49 +3,75 @@
 """
 This file is adpated from eyelinkparser.
 
+Every event class takes the whitespace-split tokens of one ASC line. match()
+checks the shape of the token list, and the constructor converts the
+numeric fields, raising TypeError if one of them is not a number.
 """
 
 import warnings
-import numbers
 import numpy as np
 try:
     import fastnumbers
 except ImportError:
-    warnings.warn('Install fastnumbers for better performance')
     fastnumbers = None
 
+_warned = False
+
+
+def check_fastnumbers():
+    """ Warns once, on first use of the event classes, if fastnumbers is missing. """
+    global _warned
+    if fastnumbers is None and not _warned:
+        warnings.warn('Install fastnumbers for better performance')
+        _warned = True
+
+
+if fastnumbers is not None:
+    def _number(token):
+        value = fastnumbers.fast_float(token, default=None)
+        if value is None:
+            raise TypeError()
+        return value
+else:
+    def _number(token):
+        try:
+            return float(token)
+        except ValueError:
+            raise TypeError()
+
 
 class Event(object):
 
-    def assert_numeric(self, l, indices):
+    __slots__ = ()
 
-        if fastnumbers is not None:
-            for i in indices:
-                if not fastnumbers.isreal(l[i]):
-                    raise TypeError()
-            return
-        for i in indices:
-            if not isinstance(l[i], (int, float)) or l[i] <= 0:
-                raise TypeError()
+    def numbers(self, l, indices):
+        """ The tokens at indices as floats; TypeError if one is not a number. """
+        return [_number(l[i]) for i in indices]
 
 
 class Blink(Event):
-    
+
     """
     desc:
         Format:
         EBLINK R 5294685	5294774	90
+        Format (without eye):
+        EBLINK 5294685	5294774	90
     """
-    
+
+    __slots__ = ('eye', 'st', 'et', 'duration')
+
     def __init__(self, l):
-        self.assert_numeric(l, range(2, 5))
-        self.st = l[2]
-        self.et = l[3]
-        self.duration = l[4]
-            
+        if len(l) == 5:
+            self.eye = l[1]
+            self.st, self.et, self.duration = self.numbers(l, (2, 3, 4))
+        else:
+            self.eye = None
+            self.st, self.et, self.duration = self.numbers(l, (1, 2, 3))
+
     @staticmethod
     def match(l):
-        return len(l) == 5 and l[0] == 'EBLINK'
+        return len(l) in (4, 5) and l[0] == 'EBLINK'
 
 
 class Fixation(Event):
@@ -55,22 +81,23 @@ class Fixation(Event):
         Format (short):
         EFIX R   1651574	1654007	2434	  653.3	  557.8	   4710
         EFIX R   299705		299872	168	  	509.0	  341.1	   2024
-        Format (long):
-        TODO
+        Format (long, with resolution):
+        EFIX R   1651574	1654007	2434	  653.3	  557.8	   4710	   38.0	   33.0
     """
 
+    __slots__ = ('eye', 'st', 'et', 'duration', 'x', 'y', 'pupil_size', 'x_res', 'y_res')
+
     def __init__(self, l):
-        self.assert_numeric(l, range(2,8))
-        self.x = l[5]
-        self.y = l[6]
-        self.pupil_size = l[7]
-        self.st = l[2]
-        self.et = l[3]
-        self.duration = self.et - self.st
-        
+        self.eye = l[1]
+        self.st, self.et, self.duration, self.x, self.y, self.pupil_size = self.numbers(l, range(2, 8))
+        if len(l) == 10:
+            self.x_res, self.y_res = self.numbers(l, (8, 9))
+        else:
+            self.x_res = self.y_res = np.nan
+
     @staticmethod
     def match(l):
-        return len(l) == 8 and l[0] == "EFIX"
+        return len(l) in (8, 10) and l[0] == "EFIX"
 
 
 class Sample(Event):
@@ -87,26 +114,20 @@ class Sample(Event):
         4333109	  981.4	  525.8	 1361.0	32768.0	...
     """
 
-    def __init__(self, l):
+    __slots__ = ('t', 'x', 'y', 'pupil_size')
 
-        self.assert_numeric(l, [0])
-        self.t = l[0]
-        if l[1] == '.':
-            self.x = np.nan
-        else:
-            self.x = l[1]
-        if l[2] == '.':
-            self.y = np.nan
-        else:
-            self.y = l[2]
-        if l[3] in (0, '.'):
+    def __init__(self, l):
+        self.t = _number(l[0])
+        self.x = np.nan if l[1] == '.' else _number(l[1])
+        self.y = np.nan if l[2] == '.' else _number(l[2])
+        if len(l) < 4 or l[3] == '.':
             self.pupil_size = np.nan
         else:
-            self.pupil_size = l[3]
-            
+            self.pupil_size = _number(l[3]) or np.nan
+
     @staticmethod
     def match(l):
-        return len(l) in (5, 6, 8, 9) and not isinstance(l[0], basestring)
+        return len(l) >= 3 and l[0].isdecimal()
 
 
 class Saccade(Event):
@@ -115,36 +136,35 @@ class Saccade(Event):
     desc:
         Format:
         ESACC R  3216221	3216233	13	  515.2	  381.6	  531.2	  390.7	   0.51	     58
-        Format (long)
-        TODO
+        Format (long, with resolution):
+        ESACC R  3216221	3216233	13	  515.2	  381.6	  531.2	  390.7	   0.51	     58	   38.0	   33.0
     """
 
-    def __init__(self, l):
+    __slots__ = ('eye', 'st', 'et', 'duration', 'sx', 'sy', 'ex', 'ey', 'amplitude',
+                 'peak_velocity', 'size', 'x_res', 'y_res')
 
-        if len(l) == 11:
-            self.assert_numeric(l, [2,3,5,6,7,8])
-            self.sx = l[5]
-            self.sy = l[6]
-            self.ex = l[7]
-            self.ey = l[8]
+    def __init__(self, l):
+        self.eye = l[1]
+        self.x_res = self.y_res = np.nan
+        if len(l) == 15:
+            self.st, self.et, self.duration, self.sx, self.sy, self.ex, self.ey = \
+                self.numbers(l, (2, 3, 4, 9, 10, 11, 12))
+            self.amplitude = self.peak_velocity = np.nan
         else:
-            self.assert_numeric(l, [2,3,9,10,11,12])
-            self.sx = l[9]
-            self.sy = l[10]
-            self.ex = l[11]
-            self.ey = l[12]
+            (self.st, self.et, self.duration, self.sx, self.sy, self.ex, self.ey,
+             self.amplitude, self.peak_velocity) = self.numbers(l, range(2, 11))
+            if len(l) == 13:
+                self.x_res, self.y_res = self.numbers(l, (11, 12))
         self.size = np.sqrt((self.sx-self.ex)**2 + (self.sy-self.ey)**2)
-        self.st = l[2]
-        self.et = l[3]
-        self.duration = self.et - self.st
-        
+
     @staticmethod
     def match(l):
-        return len(l) in (11, 15) and l[0] == 'ESACC'
+        return len(l) in (11, 13, 15) and l[0] == 'ESACC'
 
 
 def event(l, cls):
 
+    check_fastnumbers()
     if not cls.match(l):
         return None
     try:
@@ -153,7 +173,7 @@ def event(l, cls):
         pass
     except Exception as e:
         warnings.warn(
-            u'Unexpected exception during parsing of %s' % safe_decode(e))
+            u'Unexpected exception during parsing of %s' % e)
 
 class Trial(object):
     # Base class for all trials
@@ -168,4 +188,4 @@ def fixation(l):
 def saccade(l):
     return event(l, Saccade)
 def blink(l):
-    return event(l, Blink)
\ No newline at end of file
+    return event(l, Blink)
@@ -3,20 +3,51 @@
 import re
 import numpy as np
 import pandas as pd
-import math
 import json 
+from eyelinkparser._nodes import NodeLocator
+from eyelinkparser._columns import ColumnarRows, ROW_KEYS, COLUMNS
+from eyelinkparser import _mmapreader
+from eyelinkparser._events import event, check_fastnumbers, Sample, Fixation, Saccade, Blink
+from eyelinkparser._gazebins import GazeBins
+from eyelinkparser._manifest import open_digested
+
+GAZE_MODES = ('all', 'none', 'bin')
 
 class EyeLinkParser:
-    def __init__(self, eye_folder, asc_encoding='ISO-8859-1'):
+    COLUMNS = COLUMNS
+
+    def __init__(self, eye_folder, asc_encoding='ISO-8859-1', columnar=False, gaze='all', gaze_step=1,
+                 gaze_bin=0.05):
         self.eye_dirfolder = eye_folder
         # self.trial_dir = trial_dir
         self.asc_encoding = asc_encoding
         self.current_offset = np.nan
-        self.rows = []  # Collect all rows in a list to append at once
+        # Collect all rows to build the DataFrame at once, either as a list of
+        # dicts or, with columnar=True, in typed per-type columns
+        self.columnar = columnar
+        if columnar:
+            self.rows = ColumnarRows()
+            self._append = self.rows.append
+        else:
+            self.rows = []
+            self._append = self._append_dict
         self.trial_index = 0
         self.switch = 0
         self.visit = 0
         self.event = None
+        self._trial_chunks = None  # finished trials while iterating by trial
+        self.n_lines = 0  # lines read from the last text file parsed
+        # Which gaze samples become rows: 'all' as Gaze rows, 'none', or 'bin'
+        # as GazeBin rows of gaze_bin seconds per node. gaze_step keeps only
+        # every Nth sample. Dropped samples never become rows.
+        if gaze not in GAZE_MODES:
+            raise ValueError(f"Unknown gaze mode: {gaze}")
+        if gaze_step < 1:
+            raise ValueError(f"gaze_step must be at least 1: {gaze_step}")
+        self.gaze = gaze
+        self.gaze_step = gaze_step
+        self._n_samples = 0  # samples seen, for gaze_step
+        self._bins = GazeBins(gaze_bin) if gaze == 'bin' else None
         # self.wid = wid
         self.node_positions = [
         [960.0, 162.0],
@@ -31,58 +62,268 @@ class EyeLinkParser:
         [1303.840894244008, 382.97312508528705],
         [1164.3622289982159, 222.00616458981352]
         ]
+        self._locator = NodeLocator(self.node_positions)
     
     def import_trial_data(self, trial_dir):
         """ Imports trial data from a JSON file. """
         with open(trial_dir, 'r') as file:
             return json.load(file)
 
-    def parse_asc_file(self, path):
-        """ Parses the ASC file for eye-tracking data. """
+    def parse_asc_file(self, path, engine='token', by_type=False, reader='text'):
+        """ Parses the ASC file for eye-tracking data.
+
+        engine='token' classifies each line once by its first token and splits
+        the fields of samples and EFIX/ESACC/EBLINK lines directly. Anything it
+        does not recognise goes through the regex path, which can also be used
+        on its own with engine='regex'. Both produce the same DataFrame.
+        engine='events' parses through the event classes instead, which read
+        some lines the regexes miss, see parse_line_events.
+
+        reader='mmap' memory-maps the file instead of decoding it line by line,
+        see parse_asc_buffer.
+
+        With by_type=True a dict of DataFrames keyed by row Type is returned
+        instead of a single frame.
+        """
+        if reader == 'mmap':
+            with _mmapreader.open_buffer(path) as buffer:
+                return self.parse_asc_buffer(buffer, engine=engine, by_type=by_type)
+        if reader != 'text':
+            raise ValueError(f"Unknown reader: {reader}")
+        parse_line = self._line_parser(engine)
+        n_lines = 0
         with open(path, 'r', encoding=self.asc_encoding) as file:
             for line in file:
-                if 'MSG' in line:
-                    self.parse_message(line)
-                if 'EFIX' in line:
-                    self.parse_fixation(line)
-                if re.match(r"^\d+\s+\d+\.\d+\s+\d+\.\d+", line):
-                    self.parse_gaze(line)
-                if 'EBLINK' in line:
-                    self.parse_blink(line)
-                if 'ESACC' in line:
-                    self.parse_saccade(line)
+                parse_line(line)
+                n_lines += 1
+        self.n_lines = n_lines
+        self._flush_bins()
         # Convert the collected rows to a DataFrame once all lines are processed
-        self.data_frame = pd.DataFrame(self.rows)
+        self.data_frame = self._build_frame(by_type)
         return self.data_frame
 
-        
-    def assign_node(self,x, y, node_positions):
-        def euclidean_distance(p1, p2):
-            return math.sqrt((p1[0] - p2[0])**2 + (p1[1] - p2[1])**2)
+    def parse_asc_buffer(self, buffer, engine='token', by_type=False):
+        """
+        Parses ASC content from a bytes-like buffer, e.g. a memory map. Runs of
+        sample lines are parsed straight from the bytes into arrays and get
+        their nodes in one vectorized call; only message and event lines are
+        decoded and parsed one by one. Works best with columnar=True, which
+        takes the sample arrays without building a row per sample.
+        """
+        self._scan_buffer(buffer, self._line_parser(engine))
+        self._flush_bins()
+        self.data_frame = self._build_frame(by_type)
+        return self.data_frame
+
+    def parse_asc_trials(self, path, trial_index, engine='token', by_type=False, index=None):
+        """
+        Parses only some trials of an ASC file: a trial_index or an iterable
+        of them, e.g. range(10, 20). The TrialIndex of the file (see
+        load_trial_index, built on first use) gives the bytes of every
+        trial and the offset, trial, event, visit and switch state to parse
+        them from, so the rows are those a full parse gives for the trials.
+        Only gaze_step counts samples from the start of the parsed bytes.
+        Reads the file like reader='mmap'; returns what parse_asc_file does.
+        """
+        if index is None:
+            from eyelinkparser._trialindex import load_trial_index
+            index = load_trial_index(path, asc_encoding=self.asc_encoding)
+        parse_line = self._line_parser(engine)
+        with _mmapreader.open_buffer(path) as buffer:
+            for start, end, state in index.spans(trial_index):
+                self._flush_bins()
+                for name, value in state.items():
+                    setattr(self, name, value)
+                self._scan_buffer(buffer[start:end], parse_line)
+        self._flush_bins()
+        self.data_frame = self._build_frame(by_type)
+        return self.data_frame
+
+    def _scan_buffer(self, buffer, parse_line):
+        encoding = self.asc_encoding
+        for kind, payload in _mmapreader.scan(buffer):
+            if kind == 'samples':
+                self._add_gazes(*payload)
+            else:
+                parse_line(payload.decode(encoding))
+
+    def iter_asc_chunks(self, path, rows_per_chunk=100000, by_trial=False, engine='token', digest=None):
+        """
+        Parses the ASC file and yields DataFrames as it goes instead of
+        holding the whole recording. A chunk is yielded every rows_per_chunk
+        rows and, with by_trial=True, before every 'initialize' message so
+        each trial starts a new chunk. The offset, trial, visit and switch
+        state carries over from one chunk to the next. digest, a hashlib
+        object, is updated with the bytes of the file as they are read.
+        """
+        parse_line = self._line_parser(engine)
+        if by_trial:
+            self._trial_chunks = []
+        n_lines = 0
+        try:
+            file = (open(path, 'r', encoding=self.asc_encoding) if digest is None else
+                    open_digested(path, digest, self.asc_encoding))
+            with file:
+                for line in file:
+                    parse_line(line)
+                    n_lines += 1
+                    if self._trial_chunks:
+                        yield from self._trial_chunks
+                        self._trial_chunks.clear()
+                    if rows_per_chunk and len(self.rows) >= rows_per_chunk:
+                        yield self._drain()
+            self._flush_bins()
+            if len(self.rows):
+                yield self._drain()
+        finally:
+            self._trial_chunks = None
+            self.n_lines = n_lines
+
+    def _drain(self):
+        """ Builds a DataFrame from the collected rows and starts over. """
+        frame = self._build_frame()
+        if self.columnar:
+            self.rows.clear()
+        else:
+            self.rows = []
+        return frame
+
+    def _build_frame(self, by_type=False):
+        if self.columnar:
+            return self.rows.to_frames() if by_type else self.rows.to_frame()
+        if by_type:
+            kinds = dict.fromkeys(row['Type'] for row in self.rows)
+            return {kind: pd.DataFrame([row for row in self.rows if row['Type'] == kind]) for kind in kinds}
+        return pd.DataFrame(self.rows)
+
+    def _append_dict(self, kind, values):
+        self.rows.append(dict(zip(ROW_KEYS[kind], (kind,) + values)))
+
+    def _extend(self, kind, columns):
+        """ Appends many rows at once; scalar columns apply to every row. """
+        if self.columnar:
+            self.rows.extend(kind, columns)
+            return
+        n = max(len(column) for column in columns if isinstance(column, np.ndarray))
+        columns = [column.tolist() if isinstance(column, np.ndarray) else [column] * n
+                   for column in columns]
+        for values in zip(*columns):
+            self._append_dict(kind, values)
 
-        # Calculate radius for each node based on the nearest neighbor
-        radii = [float('inf')] * len(node_positions)
-        for i, node in enumerate(node_positions):
-            for j, other_node in enumerate(node_positions):
-                if i != j:
-                    distance = euclidean_distance(node, other_node)
-                    if distance < radii[i]:
-                        radii[i] = distance / 2  
-                        
-        for index, (node, radius) in enumerate(zip(node_positions, radii)):
-            distance = euclidean_distance(node, (x, y))
-            if distance <= radius:
-                return index  
+    def _line_parser(self, engine):
+        if engine == 'token':
+            return self.parse_line_tokens
+        if engine == 'regex':
+            return self.parse_line
+        if engine == 'events':
+            check_fastnumbers()
+            return self.parse_line_events
+        raise ValueError(f"Unknown parsing engine: {engine}")
 
-        return -1  
+    def parse_line(self, line):
+        """ Parses a single ASC line with substring checks and regexes. """
+        if 'MSG' in line:
+            self.parse_message(line)
+        if 'EFIX' in line:
+            self.parse_fixation(line)
+        if re.match(r"^\d+\s+\d+\.\d+\s+\d+\.\d+", line):
+            self.parse_gaze(line)
+        if 'EBLINK' in line:
+            self.parse_blink(line)
+        if 'ESACC' in line:
+            self.parse_saccade(line)
 
+    def parse_line_tokens(self, line):
+        """
+        Parses a single ASC line by its first token. Only lines whose fields
+        all have the exact shape the regexes expect are split here, every
+        other line is handed to parse_line so the output stays identical.
+        """
+        tokens = line.split()
+        if not tokens:
+            return
+        head = tokens[0]
+        n = len(tokens)
+        if line[0].isdecimal():
+            if (n >= 3 and head.isdecimal() and
+                    _is_decimal(tokens[1]) and _is_decimal(tokens[2])):
+                self._add_gaze(head, tokens[1], tokens[2])
+                return
+        elif head == 'EFIX':
+            if (n == 8 and tokens[1] in ('L', 'R') and _all_digits(tokens, 2, 5) and
+                    _is_decimal(tokens[5]) and _is_decimal(tokens[6]) and tokens[7].isdecimal()):
+                self._add_fixation(*tokens[1:])
+                return
+        elif head == 'ESACC':
+            if (n == 11 and tokens[1] in ('L', 'R') and _all_digits(tokens, 2, 5) and
+                    all(_is_decimal(token) for token in tokens[5:10]) and tokens[10].isdecimal()):
+                self._add_saccade(*tokens[1:])
+                return
+        elif head == 'EBLINK':
+            if n == 4 and _all_digits(tokens, 1, 4):
+                self._add_blink(*tokens[1:])
+                return
+        self.parse_line(line)
+
+    def parse_line_events(self, line):
+        """
+        Parses a single ASC line through the event classes of _events, picked
+        by the first token. These also read the long EFIX/ESACC formats and
+        EBLINK lines with an eye, which the regexes miss, and any real
+        number as a coordinate. Lines no event class takes, such as
+        messages, go to parse_line.
+        """
+        tokens = line.split()
+        if not tokens:
+            return
+        head = tokens[0]
+        if head.isdecimal() and len(tokens) >= 3:
+            # Samples are most lines, so they skip the generic event() call
+            try:
+                e = Sample(tokens)
+            except TypeError:
+                pass
+            else:
+                if e.x == e.x and e.y == e.y:  # not NaN, i.e. not during a blink
+                    self._add_gaze(e.t, e.x, e.y)
+                return
+        cls = _EVENT_CLASSES.get(head)
+        if cls is not None:
+            e = event(tokens, cls)
+            if e is not None:
+                if cls is Fixation:
+                    self._add_fixation(e.eye, e.st, e.et, e.duration, e.x, e.y, e.pupil_size)
+                elif cls is Saccade:
+                    self._add_saccade(e.eye, e.st, e.et, e.duration, e.sx, e.sy, e.ex, e.ey,
+                                      e.amplitude, e.peak_velocity)
+                else:
+                    self._add_blink(e.st, e.et, e.duration)
+                return
+        self.parse_line(line)
 
-        
+    def assign_node(self,x, y, node_positions):
+        """ Index of the first node whose radius contains (x, y), or -1. """
+        return self._node_locator(node_positions).assign(x, y)
+
+    def assign_nodes(self, x, y, node_positions=None):
+        """ Vectorized assign_node over arrays of x and y coordinates. """
+        if node_positions is None:
+            node_positions = self.node_positions
+        return self._node_locator(node_positions).assign_many(x, y)
+
+    def _node_locator(self, node_positions):
+        # The radii only depend on the layout, so they are computed once and
+        # recomputed only when a different layout is passed in
+        if self._locator is None or self._locator.node_positions is not node_positions:
+            self._locator = NodeLocator(node_positions)
+        return self._locator
 
     def parse_message(self, line):
         """ Parses MSG lines for time events and handles offset calculations. """
         msg_match = re.search(r"MSG\s+(\d+)\s+.*\"time\":\s+(\d+\.\d+).*\"event\":\s+\"([^\"]+)\"", line)
         if msg_match:
+            # Gaze bins end where the message changes the trial, visit or event
+            self._flush_bins()
             t_el, t_py, self.event = msg_match.groups()
             t_el, t_py = float(t_el), float(t_py)
             t_el /= 1000  # Convert to seconds
@@ -90,6 +331,8 @@ class EyeLinkParser:
             if np.isnan(self.current_offset) or "drift check" in self.event:
                 self.current_offset = offset  # Update offset if the event is 'drift check' or first time
             if self.event == 'initialize':
+                if self._trial_chunks is not None and len(self.rows):
+                    self._trial_chunks.append(self._drain())
                 self.trial_index += 1
                 self.visit = 0
                 self.switch = 0
@@ -98,47 +341,83 @@ class EyeLinkParser:
             if self.event == 'switch':
                 self.switch =+1
             
-            self.rows.append({
-                'Type': 'Message',
-                'Event': self.event,
-                'Visit': self.visit,
-                'Switch': self.switch,
-                'Time': t_el,
-                'TimeEvent': t_py,
-                'Offset': offset - self.current_offset,
-                'trial_index':self.trial_index
-            })
+            self._append('Message', (self.event, self.visit, self.switch, t_el, t_py,
+                                     offset - self.current_offset, self.trial_index))
 
     def parse_fixation(self, line):
         """ Parses fixation data from EFIX lines. """
         fixation_match = re.search(r"EFIX\s+(L|R)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+)", line)
         if fixation_match:
-            eye, start, end, duration, x, y, pupil = fixation_match.groups()
-            start, end, duration = map(lambda x: float(x) / 1000, [start, end, duration])
-            x, y, pupil = map(float, [x, y, pupil])
-            start += self.current_offset
-            end += self.current_offset
-            node = self.assign_node(x,y, self.node_positions)
-            self.rows.append({'Type': 'Fixation', 'Start': start, 'End': end, 'Duration': duration, 'Node': node, 'X': x, 'Y': y, 'Pupil': pupil,  'trial_index':self.trial_index, 'event':self.event, 'visit':self.visit, 'switch':self.switch})
+            self._add_fixation(*fixation_match.groups())
+
+    def _add_fixation(self, eye, start, end, duration, x, y, pupil):
+        start, end, duration = map(lambda x: float(x) / 1000, [start, end, duration])
+        x, y, pupil = map(float, [x, y, pupil])
+        start += self.current_offset
+        end += self.current_offset
+        node = self.assign_node(x,y, self.node_positions)
+        self._append('Fixation', (start, end, duration, node, x, y, pupil,
+                                  self.trial_index, self.event, self.visit, self.switch))
 
     def parse_gaze(self, line):
         """ Parses gaze data from lines that potentially contain gaze information. """
         gaze_match = re.search(r"(\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)", line)
         if gaze_match:
-            t, x, y = map(float, gaze_match.groups())
-            t /= 1000  # Convert to seconds
-            t += self.current_offset
-            node = self.assign_node(x, y, self.node_positions)
-            self.rows.append({'Type': 'Gaze', 'Time': t,'Node':node, 'X': x, 'Y': y, 'trial_index':self.trial_index, 'event':self.event, 'visit':self.visit, 'switch':self.switch})
+            self._add_gaze(*gaze_match.groups())
+
+    def _add_gaze(self, t, x, y):
+        if self.gaze == 'none':
+            return
+        if self.gaze_step > 1:
+            self._n_samples += 1
+            if (self._n_samples - 1) % self.gaze_step:
+                return
+        t, x, y = map(float, (t, x, y))
+        t /= 1000  # Convert to seconds
+        t += self.current_offset
+        node = self.assign_node(x, y, self.node_positions)
+        if self._bins is not None:
+            self._add_bins(self._bins.add(t, node, x, y))
+            return
+        self._append('Gaze', (t, node, x, y, self.trial_index, self.event, self.visit, self.switch))
+
+    def _add_gazes(self, t, x, y):
+        """ _add_gaze for arrays of samples that share the same message state. """
+        if self.gaze == 'none':
+            return
+        if self.gaze_step > 1:
+            keep = (self._n_samples + np.arange(len(t))) % self.gaze_step == 0
+            self._n_samples += len(t)
+            t, x, y = t[keep], x[keep], y[keep]
+            if not len(t):
+                return
+        t = t / 1000 + self.current_offset
+        nodes = self.assign_nodes(x, y)
+        if self._bins is not None:
+            self._add_bins(self._bins.add_many(t, nodes, x, y))
+            return
+        self._extend('Gaze', (t, nodes, x, y, self.trial_index, self.event, self.visit, self.switch))
+
+    def _add_bins(self, rows):
+        """ Appends finished gaze bins, (time, node, x, y, count) arrays, as GazeBin rows. """
+        if rows is not None:
+            self._extend('GazeBin', rows + (self.trial_index, self.event, self.visit, self.switch))
+
+    def _flush_bins(self):
+        if self._bins is not None:
+            self._add_bins(self._bins.flush())
 
     def parse_blink(self, line):
         """ Parses blink data from EBLINK lines. """
         blink_match = re.search(r"EBLINK\s+(\d+)\s+(\d+)\s+(\d+)", line)
         if blink_match:
-            start, end, duration = map(lambda x: float(x) / 1000, blink_match.groups())
-            start += self.current_offset
-            end += self.current_offset
-            self.rows.append({'Type': 'Blink', 'Start': start, 'End': end, 'Duration': duration, 'trial_index':self.trial_index, 'event':self.event, 'visit':self.visit, 'switch':self.switch})
+            self._add_blink(*blink_match.groups())
+
+    def _add_blink(self, start, end, duration):
+        start, end, duration = map(lambda x: float(x) / 1000, [start, end, duration])
+        start += self.current_offset
+        end += self.current_offset
+        self._append('Blink', (start, end, duration, self.trial_index, self.event, self.visit, self.switch))
     
     def parse_saccade(self, line):
         """
@@ -148,28 +427,30 @@ class EyeLinkParser:
         saccade_match = re.search(
             r"ESACC\s+(L|R)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+\.\d+)\s+(\d+)", line)
         if saccade_match:
-            eye, start, end, duration, start_x, start_y, end_x, end_y, amplitude, peak_velocity = saccade_match.groups()
-            start, end, duration = map(lambda x: float(x) / 1000, [start, end, duration])  # Convert time to seconds
-            start_x, start_y, end_x, end_y, amplitude, peak_velocity = map(float, [start_x, start_y, end_x, end_y, amplitude, peak_velocity])
-            start_node = self.assign_node(start_x, start_y, self.node_positions)
-            end_node = self.assign_node(end_x, end_y, self.node_positions)
-
-            self.rows.append({
-                'Type': 'Saccade',
-                'Eye': eye,
-                'Start': start,
-                'End': end,
-                'Duration': duration,
-                'Start_X': start_x,
-                'Start_Y': start_y,
-                'End_X': end_x,
-                'End_Y': end_y,
-                'Amplitude': amplitude,
-                'Peak_Velocity': peak_velocity,
-                'Start_Node': start_node,
-                'End_Node': end_node,
-                'trial_index': self.trial_index,
-                'event': self.event,
-                'visit': self.visit,
-                'switch': self.switch
-            })
\ No newline at end of file
+            self._add_saccade(*saccade_match.groups())
+
+    def _add_saccade(self, eye, start, end, duration, start_x, start_y, end_x, end_y, amplitude, peak_velocity):
+        start, end, duration = map(lambda x: float(x) / 1000, [start, end, duration])  # Convert time to seconds
+        start_x, start_y, end_x, end_y, amplitude, peak_velocity = map(float, [start_x, start_y, end_x, end_y, amplitude, peak_velocity])
+        start_node = self.assign_node(start_x, start_y, self.node_positions)
+        end_node = self.assign_node(end_x, end_y, self.node_positions)
+
+        self._append('Saccade', (eye, start, end, duration, start_x, start_y, end_x, end_y,
+                                 amplitude, peak_velocity, start_node, end_node,
+                                 self.trial_index, self.event, self.visit, self.switch))
+
+
+_EVENT_CLASSES = {'EFIX': Fixation, 'ESACC': Saccade, 'EBLINK': Blink}
+
+
+def _is_decimal(token):
+    """ True if token is digits, a dot and digits, like the \\d+\\.\\d+ groups. """
+    whole, dot, fraction = token.partition('.')
+    return bool(dot) and whole.isdecimal() and fraction.isdecimal()
+
+
+def _all_digits(tokens, start, stop):
+    for i in range(start, stop):
+        if not tokens[i].isdecimal():
+            return False
+    return True
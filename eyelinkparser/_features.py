@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+
+from itertools import chain
+import numpy as np
+import pandas as pd
+from eyelinkparser._corpus import Corpus
+from eyelinkparser._storage import read_eye_data
+
+NODES = range(11)
+VISITS = range(4)
+# The eye data columns and row Types the features are computed from
+FEATURE_EYE_COLUMNS = ['Type', 'trial_index', 'visit', 'Node', 'Duration', 'Start_Node', 'End_Node']
+FEATURE_EYE_TYPES = ['Fixation', 'Saccade']
+
+
+def trial_features(trial_data, eye_data, by_visit=False):
+    """
+    Gaze features of every trial, or of every trial and visit, from processed
+    trial data (trial_index, connect_nodes, non_connect_nodes and optionally
+    wid) and the parsed eye data of the same participant:
+
+    - n_fixations, n_saccades: numbers of fixations and saccades
+    - fixations_connected, fixations_non_connected: fixations on nodes in
+      connect_nodes and in non_connect_nodes of the trial
+    - dwell_<node>: total fixation duration on every node
+    - transition_<from>_<to>: number of saccades from node to node
+
+    Eye rows are aligned to their trial in one merge on trial_index, and
+    all features are counted with bincount over (trial, node) codes.
+    Trials without eye data get zeros.
+    """
+    trials = trial_data.drop_duplicates('trial_index').reset_index(drop=True)
+    n_nodes = len(NODES)
+    n_visits = len(VISITS) if by_visit else 1
+    n_groups = len(trials) * n_visits
+
+    eye_data = eye_data.loc[eye_data['Type'].isin(FEATURE_EYE_TYPES)]
+    positions = pd.DataFrame({'trial_index': trials['trial_index'].to_numpy(), 'trial': np.arange(len(trials))})
+    eye_data = eye_data.merge(positions, on='trial_index', how='inner')
+    group = eye_data['trial'].to_numpy() * n_visits
+    keep = np.ones(len(eye_data), dtype=bool)
+    if by_visit:
+        visit = eye_data['visit'].to_numpy()
+        keep = np.isin(visit, VISITS)
+        group = group + np.where(keep, visit, 0).astype(np.int64)
+    is_fixation = (eye_data['Type'] == 'Fixation').to_numpy() & keep
+    is_saccade = (eye_data['Type'] == 'Saccade').to_numpy() & keep
+
+    features = {}
+    if 'wid' in trials:
+        features['wid'] = np.repeat(trials['wid'].to_numpy(), n_visits)
+    features['trial_index'] = np.repeat(trials['trial_index'].to_numpy(), n_visits)
+    if by_visit:
+        features['visit'] = np.tile(np.array(VISITS), len(trials))
+    features['n_fixations'] = np.bincount(group[is_fixation], minlength=n_groups).astype(np.int32)
+    features['n_saccades'] = np.bincount(group[is_saccade], minlength=n_groups).astype(np.int32)
+
+    # Fixations on a node, by node and by whether the trial connects the node
+    node, on_node = _nodes(eye_data['Node'], n_nodes)
+    on_node &= is_fixation
+    trial = eye_data['trial'].to_numpy()[on_node]
+    fixation_group, fixation_node = group[on_node], node[on_node]
+    for name, column in (('fixations_connected', 'connect_nodes'), ('fixations_non_connected', 'non_connect_nodes')):
+        member = _membership(trials[column], n_nodes)[trial, fixation_node]
+        features[name] = np.bincount(fixation_group[member], minlength=n_groups).astype(np.int32)
+    dwell = np.bincount(fixation_group * n_nodes + fixation_node,
+                        weights=eye_data['Duration'].to_numpy()[on_node], minlength=n_groups * n_nodes)
+    for i, node_name in enumerate(NODES):
+        features[f'dwell_{node_name}'] = dwell[i::n_nodes]
+
+    # Saccades between two nodes
+    start, on_start = _nodes(eye_data['Start_Node'], n_nodes)
+    end, on_end = _nodes(eye_data['End_Node'], n_nodes)
+    between = is_saccade & on_start & on_end
+    transitions = np.bincount((group[between] * n_nodes + start[between]) * n_nodes + end[between],
+                              minlength=n_groups * n_nodes * n_nodes).astype(np.int32)
+    for i, from_node in enumerate(NODES):
+        for j, to_node in enumerate(NODES):
+            features[f'transition_{from_node}_{to_node}'] = transitions[i * n_nodes + j::n_nodes * n_nodes]
+    return pd.DataFrame(features)
+
+
+def corpus_features(corpus, eye_paths, by_visit=False):
+    """
+    trial_features of every participant in a Corpus (or its path) that has
+    eye data, in one pass. eye_paths maps wid to that participant's eye
+    data in any format read_eye_data reads; only the needed columns and row
+    Types are loaded.
+    """
+    if not isinstance(corpus, Corpus):
+        corpus = Corpus(corpus)
+    wids = [wid for wid in corpus.wids if wid in eye_paths]
+    trials = corpus.load(columns=['wid', 'trial_index', 'connect_nodes', 'non_connect_nodes'], wid=wids, index=False)
+    frames = []
+    for wid, trial_data in trials.groupby('wid', sort=False):
+        eye_data = read_eye_data(eye_paths[wid], columns=FEATURE_EYE_COLUMNS, types=FEATURE_EYE_TYPES)
+        frames.append(trial_features(trial_data, eye_data, by_visit))
+    if not frames:
+        return trial_features(trials, pd.DataFrame(columns=FEATURE_EYE_COLUMNS), by_visit)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _nodes(column, n_nodes):
+    """ Node numbers as ints, and which of them are one of the nodes. """
+    values = column.to_numpy(dtype=float)
+    valid = (values >= 0) & (values < n_nodes)
+    return np.where(valid, values, 0).astype(np.int64), valid
+
+
+def _membership(node_lists, n_nodes):
+    """ Boolean (trial, node) matrix of the nodes in every trial's list. """
+    lengths = np.fromiter(map(len, node_lists), dtype=np.int64, count=len(node_lists))
+    nodes = np.fromiter(chain.from_iterable(node_lists), dtype=np.int64, count=int(lengths.sum()))
+    trials = np.repeat(np.arange(len(node_lists)), lengths)
+    valid = (nodes >= 0) & (nodes < n_nodes)
+    membership = np.zeros((len(node_lists), n_nodes), dtype=bool)
+    membership[trials[valid], nodes[valid]] = True
+    return membership
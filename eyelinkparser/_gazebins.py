@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+
+import numpy as np
+
+
+class GazeBins:
+    """
+    Aggregates gaze samples into fixed time bins per node: the number of
+    samples on every node within a bin and their mean x and y. Samples come
+    in time order; the rows of a bin are returned once a sample of another
+    bin arrives, or by flush(). Rows are returned as (time, node, x, y,
+    count) arrays, time being the start of the bin, ordered by bin and
+    node. Samples without a time (before the first message) share one bin
+    with a NaN time.
+    """
+
+    def __init__(self, width):
+        if not width > 0:
+            raise ValueError(f"Bin width must be positive: {width}")
+        self.width = width
+        self._bin = None  # bin number of the pending samples, None for no time
+        self._sums = {}  # node -> [count, sum of x, sum of y] of the pending bin
+
+    def __len__(self):
+        return len(self._sums)
+
+    def add(self, t, node, x, y):
+        """ Adds one sample; returns the rows of the bin it finished, or None. """
+        b = None if t != t else t // self.width
+        finished = None
+        if b != self._bin:
+            finished = self.flush()
+            self._bin = b
+        sums = self._sums.get(node)
+        if sums is None:
+            self._sums[node] = [1, x, y]
+        else:
+            sums[0] += 1
+            sums[1] += x
+            sums[2] += y
+        return finished
+
+    def add_many(self, t, nodes, x, y):
+        """ add() for arrays of samples; returns the rows of the bins they finished, or None. """
+        if not len(t):
+            return None
+        bins = np.floor_divide(t, self.width)
+        if np.isnan(bins[0]):
+            # Without a time, all samples fall in the one bin without a time
+            finished = self.flush() if self._bin is not None else None
+            self._bin = None
+            self._accumulate(nodes, x, y)
+            return finished
+        finished = []
+        pending = bins == self._bin if self._bin is not None else np.zeros(len(bins), dtype=bool)
+        self._accumulate(nodes[pending], x[pending], y[pending])
+        rest = ~pending
+        if rest.any():
+            rows = self.flush()
+            if rows is not None:
+                finished.append(rows)
+            bins, nodes, x, y = bins[rest], nodes[rest], x[rest], y[rest]
+            last = bins == bins[-1]
+            complete = ~last
+            if complete.any():
+                finished.append(_aggregate(bins[complete] * self.width, nodes[complete], x[complete], y[complete]))
+            self._bin = bins[-1]
+            self._accumulate(nodes[last], x[last], y[last])
+        if not finished:
+            return None
+        return tuple(np.concatenate(columns) for columns in zip(*finished))
+
+    def flush(self):
+        """ Returns the rows of the pending bin, or None if there are none, and clears it. """
+        if not self._sums:
+            self._bin = None
+            return None
+        nodes = sorted(self._sums)
+        counts = np.array([self._sums[node][0] for node in nodes], dtype=np.int64)
+        x = np.array([self._sums[node][1] for node in nodes], dtype=float) / counts
+        y = np.array([self._sums[node][2] for node in nodes], dtype=float) / counts
+        start = np.nan if self._bin is None else self._bin * self.width
+        self._sums = {}
+        self._bin = None  # the next samples start a bin afresh, wherever parsing resumes
+        return np.full(len(nodes), start), np.array(nodes, dtype=np.int64), x, y, counts
+
+    def _accumulate(self, nodes, x, y):
+        if not len(nodes):
+            return
+        nodes = np.asarray(nodes, dtype=np.int64)
+        present, inverse = np.unique(nodes, return_inverse=True)
+        counts = np.bincount(inverse)
+        sum_x = np.bincount(inverse, weights=x)
+        sum_y = np.bincount(inverse, weights=y)
+        for node, count, sx, sy in zip(present.tolist(), counts.tolist(), sum_x.tolist(), sum_y.tolist()):
+            sums = self._sums.get(node)
+            if sums is None:
+                self._sums[node] = [count, sx, sy]
+            else:
+                sums[0] += count
+                sums[1] += sx
+                sums[2] += sy
+
+
+def _aggregate(starts, nodes, x, y):
+    """ Rows of complete bins from samples in bin order: one per (bin, node). """
+    nodes = np.asarray(nodes, dtype=np.int64)
+    order = np.lexsort((nodes, starts))
+    starts, nodes, x, y = starts[order], nodes[order], x[order], y[order]
+    first = np.flatnonzero(np.r_[True, (starts[1:] != starts[:-1]) | (nodes[1:] != nodes[:-1])])
+    counts = np.diff(np.r_[first, len(starts)])
+    return (starts[first], nodes[first], np.add.reduceat(x, first) / counts,
+            np.add.reduceat(y, first) / counts, counts)
@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+
+import cProfile
+import os
+import platform
+import sys
+import time
+from contextlib import contextmanager
+from eyelinkparser._manifest import write_json
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_rss():
+    """ Peak resident set size of this process in bytes, or None if unknown. """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+class Stage:
+    """
+    Timing and counts of one stage of processing one participant. Counts
+    such as lines or rows get a per-second rate in the report; events
+    counts rows per Type.
+
+    Memory is reported twice: process_peak_rss is the peak of the whole
+    process when the stage last stopped, which includes earlier stages and
+    participants run in the same process, and peak_rss_growth is how much
+    that peak rose while the stage ran, i.e. the memory the stage itself
+    added on top of anything used before.
+    """
+
+    def __init__(self, name, participant=None):
+        self.name = name
+        self.participant = participant
+        self.wall = 0.
+        self.cpu = 0.
+        self.counts = {}
+        self.events = {}
+        self.process_peak_rss = None
+        self.peak_rss_growth = None
+        self._t0 = None
+
+    def count(self, **counts):
+        for key, value in counts.items():
+            self.counts[key] = self.counts.get(key, 0) + int(value)
+
+    def count_events(self, frame):
+        """ Adds the rows per Type of an eye data frame to the events counts. """
+        if 'Type' not in frame:
+            return
+        for kind, n in frame['Type'].value_counts(sort=False).items():
+            if n:
+                self.events[kind] = self.events.get(kind, 0) + int(n)
+
+    def to_dict(self):
+        record = {'stage': self.name, 'participant': self.participant,
+                  'wall_s': self.wall, 'cpu_s': self.cpu}
+        for key, value in self.counts.items():
+            record[key] = value
+            record[f'{key}_per_s'] = value / self.wall if self.wall > 0 else None
+        if self.events:
+            record['events'] = self.events
+        record['process_peak_rss_bytes'] = self.process_peak_rss
+        record['peak_rss_growth_bytes'] = self.peak_rss_growth
+        return record
+
+
+class RunReport:
+    """
+    Collects the stages of a processing run and writes them as a JSON
+    report. With profile_dir set, every stage is also run under cProfile
+    and its stats dumped to <profile_dir>/<participant>.<stage>.prof. The
+    profile of a stage only holds its own calls: the profiler of an
+    enclosing stage is paused while a nested stage, or the producer of
+    timed(), runs. Reports from worker processes are merged with add().
+    """
+
+    def __init__(self, profile_dir=None):
+        self.profile_dir = profile_dir
+        self.started = time.time()
+        self.stages = []
+        self._profiles = []  # profilers of the open stages, innermost last
+
+    @contextmanager
+    def stage(self, name, participant=None):
+        """ Times the body of a with block as one stage. """
+        stage = Stage(name, participant)
+        profile = self._resume_profile() if self.profile_dir is not None else None
+        self._start(stage)
+        try:
+            yield stage
+        finally:
+            self._stop(stage)
+            if profile is not None:
+                self._pause_profile(profile)
+                self._dump(stage, profile)
+
+    def timed(self, items, stage, within=None):
+        """
+        Yields from items and adds only the time spent producing them to
+        stage, e.g. for a parser feeding a writer. If the consuming stage is
+        given as within, that time is taken off it. Frames are counted as
+        rows and events.
+        """
+        iterator = iter(items)
+        profile = cProfile.Profile() if self.profile_dir is not None else None
+        try:
+            while True:
+                wall, cpu = stage.wall, stage.cpu
+                if profile is not None:
+                    self._resume_profile(profile)
+                self._start(stage)
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+                finally:
+                    self._stop(stage)
+                    if profile is not None:
+                        self._pause_profile(profile)
+                    if within is not None:
+                        within.wall -= stage.wall - wall
+                        within.cpu -= stage.cpu - cpu
+                if hasattr(item, 'columns'):
+                    stage.count(rows=len(item))
+                    stage.count_events(item)
+                yield item
+        finally:
+            if profile is not None:
+                self._dump(stage, profile)
+
+    def _resume_profile(self, profile=None):
+        """ Pauses the profiler of the enclosing stage and starts profile, or a new one. """
+        if self._profiles:
+            self._profiles[-1].disable()
+        profile = profile or cProfile.Profile()
+        self._profiles.append(profile)
+        profile.enable()
+        return profile
+
+    def _pause_profile(self, profile):
+        """ Stops profile and resumes the profiler of the enclosing stage. """
+        profile.disable()
+        self._profiles.pop()
+        if self._profiles:
+            self._profiles[-1].enable()
+
+    def _start(self, stage):
+        if stage not in self.stages:
+            self.stages.append(stage)
+        stage._t0 = time.perf_counter(), time.process_time(), peak_rss()
+
+    def _stop(self, stage):
+        t0, cpu0, peak0 = stage._t0
+        stage.wall += time.perf_counter() - t0
+        stage.cpu += time.process_time() - cpu0
+        stage.process_peak_rss = peak_rss()
+        if peak0 is not None:
+            stage.peak_rss_growth = (stage.peak_rss_growth or 0) + stage.process_peak_rss - peak0
+
+    def _dump(self, stage, profile):
+        os.makedirs(self.profile_dir, exist_ok=True)
+        name = f'{stage.participant}.{stage.name}.prof' if stage.participant else f'{stage.name}.prof'
+        profile.dump_stats(os.path.join(self.profile_dir, name.replace(os.sep, '_')))
+
+    def add(self, records):
+        """ Adds stage records (Stage.to_dict output) from another report. """
+        self.stages.extend(records)
+
+    def records(self):
+        return [stage.to_dict() if isinstance(stage, Stage) else stage for stage in self.stages]
+
+    def to_dict(self):
+        records = self.records()
+        totals = {}
+        for record in records:
+            total = totals.setdefault(record['stage'], {'wall_s': 0., 'cpu_s': 0.})
+            total['wall_s'] += record['wall_s']
+            total['cpu_s'] += record['cpu_s']
+            for key, value in record.items():
+                if key in ('lines', 'rows', 'trials'):
+                    total[key] = total.get(key, 0) + value
+        return {
+            'started': time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(self.started)),
+            'wall_s': time.time() - self.started,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'peak_rss_bytes': peak_rss(),
+            'totals': totals,
+            'stages': records,
+        }
+
+    def save(self, path):
+        """ Writes the report as JSON, atomically. """
+        write_json(path, self.to_dict())
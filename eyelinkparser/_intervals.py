@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+from itertools import chain
+import numpy as np
+import pandas as pd
+
+# Row Type -> the columns holding its start and end on the python clock
+TIME_COLUMNS = {
+    'Gaze': ('Time', 'Time'),
+    'GazeBin': ('Time', 'Time'),
+    'Fixation': ('Start', 'End'),
+    'Blink': ('Start', 'End'),
+    'Saccade': ('Start', 'End'),
+}
+# Row Types whose times EyeLinkParser leaves on the tracker clock
+TRACKER_TYPES = ('Saccade',)
+POINTS = ('start', 'end', 'mid')
+
+
+class OffsetTimeline:
+    """
+    The offsets between the tracker clock and the python clock that
+    EyeLinkParser applied while parsing: the offset (python time minus
+    tracker time) of the first message, replaced at every 'drift check'
+    message. Times are in seconds.
+    """
+
+    def __init__(self, starts, offsets):
+        order = np.argsort(starts, kind='stable')
+        self.starts = np.asarray(starts, dtype=float)[order]
+        self.offsets = np.asarray(offsets, dtype=float)[order]
+
+    @classmethod
+    def from_messages(cls, eye_data):
+        """ The timeline rebuilt from the Message rows of parsed eye data. """
+        messages = eye_data[eye_data['Type'] == 'Message'].sort_values('Time', kind='stable')
+        time = messages['Time'].to_numpy(dtype=float)
+        offset = messages['TimeEvent'].to_numpy(dtype=float) - time
+        reset = np.array(messages['Event'].astype(object).str.contains('drift check', regex=False, na=False), dtype=bool)
+        reset[:1] = True
+        return cls(time[reset], offset[reset])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def offset(self, tracker_times):
+        """ The offset in effect at every tracker time; NaN before the first message. """
+        tracker_times = np.asarray(tracker_times, dtype=float)
+        position = np.searchsorted(self.starts, tracker_times, side='right')
+        return np.r_[np.nan, self.offsets][position]
+
+    def to_python(self, tracker_times):
+        """ Tracker times converted to the python clock, as EyeLinkParser does. """
+        tracker_times = np.asarray(tracker_times, dtype=float)
+        return tracker_times + self.offset(tracker_times)
+
+
+class EventIntervals:
+    """
+    The trial events of a participant as intervals on the python clock.
+    Every event in a trial's events list starts an interval that lasts until
+    the next event, of the same trial or the next one. An interval carries
+    the state EyeLinkParser keeps after the matching message: trial_index,
+    event, visit (the visits so far in the trial) and switch. Times before
+    the first event get trial 0 and no event, like rows before the first
+    'initialize' message.
+
+    Intervals are kept sorted by start, so locating any number of times is
+    one searchsorted.
+    """
+
+    def __init__(self, starts, trial_index, event, visit, switch):
+        starts = np.asarray(starts, dtype=float)
+        order = np.argsort(starts, kind='stable')
+        codes, self.categories = pd.factorize(np.asarray(event, dtype=object)[order])
+        self.starts = starts[order]
+        # Entry 0 is the state before the first interval
+        self._trial_index = np.r_[0, np.asarray(trial_index, dtype=np.int64)[order]]
+        self._event = np.r_[-1, codes]
+        self._visit = np.r_[0, np.asarray(visit, dtype=np.int64)[order]]
+        self._switch = np.r_[0, np.asarray(switch, dtype=np.int64)[order]]
+
+    @classmethod
+    def from_trials(cls, trial_data):
+        """
+        The intervals of trial data with an 'events' column, raw or
+        processed by TrialProcessor. Trials are numbered by their
+        trial_index column, or from 1 in order like TrialProcessor does.
+        """
+        if 'trial_index' in trial_data:
+            trial_data = trial_data.drop_duplicates('trial_index')
+            trial_index = trial_data['trial_index'].to_numpy(dtype=np.int64)
+        else:
+            trial_index = np.arange(1, len(trial_data) + 1)
+        events = list(trial_data['events'])
+        lengths = np.fromiter(map(len, events), dtype=np.int64, count=len(events))
+        table = pd.DataFrame.from_records(list(chain.from_iterable(events)), columns=['event', 'time'])
+        trial = np.repeat(np.arange(len(events)), lengths)
+        first = np.repeat(np.cumsum(lengths) - lengths, lengths)  # position of every event's first trial event
+
+        # Visits and switches so far within the trial, counting the event itself
+        visits = np.cumsum((table['event'] == 'visit').to_numpy())
+        switches = np.cumsum((table['event'] == 'switch').to_numpy())
+        visit = visits - np.r_[0, visits][first]
+        switch = (switches - np.r_[0, switches][first] > 0).astype(np.int64)
+
+        time = table['time'].to_numpy(dtype=float)
+        timed = ~np.isnan(time)
+        return cls(time[timed], trial_index[trial[timed]], table['event'].to_numpy(dtype=object)[timed],
+                   visit[timed], switch[timed])
+
+    def __len__(self):
+        return len(self.starts)
+
+    def locate(self, times):
+        """
+        The interval every python time falls in, as positions into the
+        sorted intervals, or -1 before the first one or for NaN times.
+        """
+        times = np.asarray(times, dtype=float)
+        return self._entries(times) - 1
+
+    def labels(self, times):
+        """ trial_index, event, visit and switch arrays for every python time. """
+        entry = self._entries(np.asarray(times, dtype=float))
+        events = np.r_[np.asarray(self.categories, dtype=object), np.nan]  # code -1 picks NaN
+        return {
+            'trial_index': self._trial_index[entry],
+            'event': events[self._event[entry]],
+            'visit': self._visit[entry],
+            'switch': self._switch[entry],
+        }
+
+    def _entries(self, times):
+        entry = np.searchsorted(self.starts, times, side='right')
+        entry[np.isnan(times)] = 0
+        return entry
+
+
+def eye_times(eye_data, timeline=None, at='start'):
+    """
+    The python time of every eye data row: Time for gaze, and Start, End or
+    their midpoint (at='start', 'end' or 'mid') for fixations, saccades and
+    blinks. Saccade times, which EyeLinkParser leaves on the tracker clock,
+    are converted with the timeline, rebuilt from the Message rows if not
+    given. Other rows, such as messages, get NaN.
+    """
+    if at not in POINTS:
+        raise ValueError(f"Unknown interval point: {at}")
+    times = np.full(len(eye_data), np.nan)
+    type_rows = _type_rows(eye_data)
+    for row_type, (start_column, end_column) in TIME_COLUMNS.items():
+        rows = type_rows.get(row_type)
+        if rows is None:
+            continue
+        start = eye_data[start_column].to_numpy(dtype=float)[rows]
+        end = eye_data[end_column].to_numpy(dtype=float)[rows]
+        values = start if at == 'start' else end if at == 'end' else (start + end) / 2
+        if row_type in TRACKER_TYPES:
+            if timeline is None:
+                if 'Message' not in type_rows:
+                    raise ValueError(f"{row_type} times are on the tracker clock; "
+                                     f"Message rows are needed to convert them")
+                timeline = OffsetTimeline.from_messages(eye_data.iloc[type_rows['Message']])
+            values = timeline.to_python(values)
+        times[rows] = values
+    return times
+
+
+def assign_intervals(eye_data, trial_data, timeline=None, at='start'):
+    """
+    Eye data with trial_index, event, visit and switch taken from the trial
+    data event interval every fixation, saccade, blink and gaze row falls
+    in (see eye_times for which time), instead of the message state
+    EyeLinkParser kept while parsing. trial_data is EventIntervals or trial
+    data with an 'events' column. Other rows keep their values. Returns a
+    new frame; the eye data passed in is not changed.
+    """
+    intervals = trial_data if isinstance(trial_data, EventIntervals) else EventIntervals.from_trials(trial_data)
+    times = eye_times(eye_data, timeline, at)
+    type_rows = _type_rows(eye_data)
+    rows = np.sort(np.concatenate([type_rows[row_type] for row_type in TIME_COLUMNS if row_type in type_rows] +
+                                  [np.zeros(0, dtype=np.int64)]))
+    entry = intervals._entries(times[rows])
+    eye_data = eye_data.copy(deep=False)  # only whole columns are replaced below
+    for column, values in (('trial_index', intervals._trial_index), ('visit', intervals._visit),
+                           ('switch', intervals._switch)):
+        if column in eye_data:
+            updated = eye_data[column].to_numpy(copy=True)
+            if updated.dtype.kind not in 'iuf':
+                updated = updated.astype(float)
+            updated[rows] = values[entry]
+            eye_data[column] = updated
+    if 'event' in eye_data:
+        eye_data['event'] = _replace_events(eye_data['event'], rows, intervals.categories, intervals._event[entry])
+    return eye_data
+
+
+def _type_rows(eye_data):
+    """ Row Type -> positions of its rows, from one factorization of the Type column. """
+    codes, kinds = pd.factorize(eye_data['Type'])
+    return {kind: np.flatnonzero(codes == i) for i, kind in enumerate(kinds)}
+
+
+def _replace_events(column, rows, categories, codes):
+    """
+    The event column with the events of the given rows replaced by
+    categories[codes] (NaN for code -1). A categorical column stays
+    categorical and is updated through its codes.
+    """
+    if isinstance(column.dtype, pd.CategoricalDtype):
+        old = column.cat.categories
+        known = set(old)
+        new = [category for category in categories if category not in known]
+        merged = old.append(pd.Index(new, dtype=old.dtype)) if new else old
+        mapping = np.r_[merged.get_indexer(categories), -1]
+        updated = column.cat.codes.to_numpy(copy=True)
+        updated[rows] = mapping[codes]
+        return pd.Categorical.from_codes(updated, categories=merged)
+    updated = column.to_numpy(dtype=object, copy=True)
+    updated[rows] = np.r_[np.asarray(categories, dtype=object), np.nan][codes]
+    return updated
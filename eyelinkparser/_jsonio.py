@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+
+import json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+BACKENDS = ('orjson', 'ujson', 'json')
+# 'indent' is pretty-printed JSON, 'compact' has no whitespace and 'lines'
+# writes one compact record per line (JSON lines, stored as .jsonl)
+JSON_MODES = ('indent', 'compact', 'lines')
+
+
+def default_backend():
+    """ The fastest JSON library that is installed. """
+    if orjson is not None:
+        return 'orjson'
+    if ujson is not None:
+        return 'ujson'
+    return 'json'
+
+
+class JSONSerializer:
+    """
+    Reads and writes experiment and trial JSON with orjson or ujson when
+    they are installed and the json module otherwise. Indented output is
+    always written by the json module, indented by 4 spaces, so it does not
+    depend on which libraries are installed. Lists of records can be
+    written from any iterable, one record at a time, so they never have to
+    be held in memory as a whole.
+    """
+
+    def __init__(self, backend=None, mode='indent'):
+        backend = backend or default_backend()
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown JSON backend: {backend}")
+        if mode not in JSON_MODES:
+            raise ValueError(f"Unknown JSON mode: {mode}")
+        if backend == 'orjson' and orjson is None or backend == 'ujson' and ujson is None:
+            raise ImportError(f"Install {backend} to use it as JSON backend")
+        self.backend = backend
+        self.mode = mode
+        self.indent = 4 if mode == 'indent' else None
+
+    @property
+    def extension(self):
+        return '.jsonl' if self.mode == 'lines' else '.json'
+
+    def dumps(self, obj, indent=None):
+        """
+        Serializes obj to bytes, indented by the given number of spaces or
+        compact. Indented JSON is written by the json module, whose layout
+        the other libraries do not all reproduce.
+        """
+        if indent:
+            return json.dumps(obj, indent=indent).encode('utf-8')
+        if self.backend == 'orjson':
+            return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        if self.backend == 'ujson':
+            return ujson.dumps(obj, ensure_ascii=False).encode('utf-8')
+        return json.dumps(obj, separators=(',', ':')).encode('utf-8')
+
+    def loads(self, data):
+        if self.backend == 'orjson':
+            return orjson.loads(data)
+        if self.backend == 'ujson':
+            return ujson.loads(data)
+        return json.loads(data)
+
+    def load(self, path):
+        """ Reads a JSON file, or a JSON lines file (.jsonl) as a list of records. """
+        if path.endswith('.jsonl'):
+            return list(self.iter_records(path))
+        with open(path, 'rb') as file:
+            return self.loads(file.read())
+
+    def iter_records(self, path):
+        """ Yields the records of a JSON lines file one at a time. """
+        with open(path, 'rb') as file:
+            for line in file:
+                if line.strip():
+                    yield self.loads(line)
+
+    def dump(self, obj, path):
+        """ Writes obj to path; lists are written record by record. """
+        if isinstance(obj, list):
+            return self.write_records(obj, path)
+        with open(path, 'wb') as file:
+            file.write(self.dumps(obj, self.indent))
+            if self.mode == 'lines':
+                file.write(b'\n')
+
+    def write_records(self, records, path):
+        """
+        Writes an iterable of records to path as a JSON array, or as JSON
+        lines in 'lines' mode, and returns the number of records written.
+        Indented output is laid out as dumping the whole list would be.
+        """
+        n_records = 0
+        with open(path, 'wb') as file:
+            if self.mode == 'lines':
+                for record in records:
+                    file.write(self.dumps(record) + b'\n')
+                    n_records += 1
+                return n_records
+            if self.indent:
+                prefix = b'\n' + b' ' * self.indent
+                separator = b',' + prefix
+            else:
+                prefix, separator = b'', b','
+            for record in records:
+                file.write(separator if n_records else b'[' + prefix)
+                file.write(self.dumps(record, self.indent).replace(b'\n', prefix))
+                n_records += 1
+            file.write((b'\n]' if self.indent else b']') if n_records else b'[]')
+        return n_records
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+import hashlib
+import io
+import json
+import os
+
+
+def file_digest(path, block_size=1 << 20):
+    """ SHA-256 hex digest of a file, read in blocks. """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DigestFile(io.FileIO):
+    """
+    A file opened for binary reading that feeds every byte read into a
+    hashlib digest, so a file can be hashed by the read that processes it.
+    """
+
+    def __init__(self, path, digest):
+        super().__init__(path, 'rb')
+        self.digest = digest
+
+    def readinto(self, buffer):
+        n = super().readinto(buffer)
+        if n:
+            self.digest.update(memoryview(buffer)[:n])
+        return n
+
+
+def open_digested(path, digest, encoding):
+    """ path opened for reading text like open(path, encoding=encoding), hashed into digest as it is read. """
+    return io.TextIOWrapper(io.BufferedReader(DigestFile(path, digest)), encoding=encoding)
+
+
+def parser_version():
+    """ The eyelinkparser version, recorded with everything built from parsed files. """
+    from eyelinkparser import __version__
+    return __version__
+
+
+def write_json(path, data):
+    """
+    Writes data as indented JSON through a temporary file, so an
+    interrupted write cannot leave a corrupt file behind.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as file:
+        json.dump(data, file, indent=4)
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    """
+    Records, per input file, its size, mtime and SHA-256, the parser version
+    and the output it was processed into, so unchanged inputs can be skipped
+    on the next run. Stored as JSON.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path) as file:
+                self.entries = json.load(file)
+
+    def is_current(self, input_path, output_path, parser_version):
+        """
+        True if input_path was processed into output_path by this parser
+        version and has not changed since. A file whose mtime changed but
+        whose content did not is still current.
+        """
+        entry = self.entries.get(input_path)
+        if (entry is None or entry['output'] != output_path or
+                entry['parser_version'] != parser_version or not os.path.exists(output_path)):
+            return False
+        stat = os.stat(input_path)
+        if stat.st_size != entry['size']:
+            return False
+        if stat.st_mtime_ns == entry['mtime_ns']:
+            return True
+        if file_digest(input_path) != entry['sha256']:
+            return False
+        entry['mtime_ns'] = stat.st_mtime_ns
+        return True
+
+    def record(self, input_path, output_path, parser_version, sha256=None):
+        """
+        Records that input_path was processed into output_path. sha256 is
+        the hex digest of the input if it was computed while processing it;
+        otherwise the input is read again to compute it.
+        """
+        stat = os.stat(input_path)
+        self.entries[input_path] = {
+            'input': input_path,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': sha256 or file_digest(input_path),
+            'parser_version': parser_version,
+            'output': output_path,
+        }
+
+    def save(self):
+        """ Writes the manifest atomically so an interrupted run cannot corrupt it. """
+        write_json(self.path, self.entries)
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import mmap
+import re
+from contextlib import contextmanager
+from itertools import chain
+import numpy as np
+
+# Every line that does not start with a digit: messages, events, headers
+_OTHER_LINE = re.compile(rb'^[^0-9\r\n][^\n]*', re.M)
+# The fields EyeLinkParser.parse_gaze reads from a sample line
+_SAMPLE = re.compile(rb'^(\d+)[^\S\n]+(\d+\.\d+)[^\S\n]+(\d+\.\d+)', re.M)
+
+
+@contextmanager
+def open_buffer(path):
+    """ Memory-maps a file read-only; empty files give an empty buffer. """
+    with open(path, 'rb') as file:
+        try:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # mmap refuses empty files
+            yield b''
+            return
+        try:
+            yield buffer
+        finally:
+            buffer.close()
+
+
+def scan(buffer):
+    """
+    Splits an ASC buffer into runs of sample lines and single other lines,
+    in file order. Yields ('samples', (t, x, y)) with float arrays parsed
+    straight from the bytes of each run, and ('line', raw_bytes) for every
+    line that does not start with a digit. Sample lines without numeric
+    gaze, e.g. during blinks, produce no samples just as in parse_gaze.
+    """
+    pos = 0
+    for match in _OTHER_LINE.finditer(buffer):
+        if match.start() > pos:
+            samples = _samples(buffer, pos, match.start())
+            if samples is not None:
+                yield 'samples', samples
+        yield 'line', match.group()
+        pos = match.end()
+    if len(buffer) > pos:
+        samples = _samples(buffer, pos, len(buffer))
+        if samples is not None:
+            yield 'samples', samples
+
+
+def _samples(buffer, start, end):
+    fields = _SAMPLE.findall(buffer, start, end)
+    if not fields:
+        return None
+    # float() parses the byte strings directly, without decoding them first
+    values = np.fromiter(map(float, chain.from_iterable(fields)), dtype=np.float64,
+                         count=3 * len(fields)).reshape(-1, 3)
+    return values[:, 0], values[:, 1], values[:, 2]
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+import math
+import numpy as np
+
+
+def node_radii(node_positions):
+    """
+    Radius of each node, derived from its neighbours exactly the way
+    EyeLinkParser.assign_node has always done it: the radius is halved
+    whenever a neighbour is closer than the current radius.
+    """
+    radii = [float('inf')] * len(node_positions)
+    for i, node in enumerate(node_positions):
+        for j, other_node in enumerate(node_positions):
+            if i != j:
+                distance = math.sqrt((node[0] - other_node[0])**2 + (node[1] - other_node[1])**2)
+                if distance < radii[i]:
+                    radii[i] = distance / 2
+    return radii
+
+
+class NodeLocator:
+    """
+    Maps gaze coordinates to the index of the first node whose circle
+    contains them, or -1. The radii are computed once. Large layouts are
+    looked up through a uniform grid, small ones are checked directly;
+    both return the same first match as the original loop.
+    """
+
+    GRID_THRESHOLD = 32
+    BATCH_SIZE = 1000000
+
+    def __init__(self, node_positions):
+        self.node_positions = node_positions
+        self.radii = node_radii(node_positions)
+        self._nodes = [(float(x), float(y), r) for (x, y), r in zip(node_positions, self.radii)]
+        self._x = np.array([node[0] for node in self._nodes], dtype=float)
+        self._y = np.array([node[1] for node in self._nodes], dtype=float)
+        self._r = np.array(self.radii, dtype=float)
+        self._grid = None
+        if len(self._nodes) > self.GRID_THRESHOLD and np.isfinite(self._r).all():
+            self._grid = self._build_grid()
+
+    def assign(self, x, y):
+        """ Node index for a single point. """
+        for index, (node_x, node_y, radius) in enumerate(self._nodes):
+            if math.sqrt((node_x - x)**2 + (node_y - y)**2) <= radius:
+                return index
+        return -1
+
+    def assign_many(self, x, y):
+        """ Node indices for arrays of x/y coordinates in one vectorized call. """
+        x = np.asarray(x, dtype=float)
+        y = np.asarray(y, dtype=float)
+        nodes = np.full(x.shape, -1, dtype=np.int64)
+        if not len(self._nodes) or not x.size:
+            return nodes
+        flat_x, flat_y, flat_nodes = x.ravel(), y.ravel(), nodes.ravel()
+        lookup = self._assign_grid if self._grid is not None else self._assign_direct
+        for start in range(0, flat_x.size, self.BATCH_SIZE):
+            stop = start + self.BATCH_SIZE
+            flat_nodes[start:stop] = lookup(flat_x[start:stop], flat_y[start:stop])
+        return nodes
+
+    def _assign_direct(self, x, y):
+        inside = np.sqrt((self._x - x[:, None])**2 + (self._y - y[:, None])**2) <= self._r
+        return np.where(inside.any(axis=1), inside.argmax(axis=1), -1)
+
+    def _build_grid(self):
+        cell = float(self._r.max())
+        x0 = float((self._x - self._r).min())
+        y0 = float((self._y - self._r).min())
+        nx = int(((self._x + self._r).max() - x0) // cell) + 2
+        ny = int(((self._y + self._r).max() - y0) // cell) + 2
+        cells = [[] for _ in range(nx * ny)]
+        for index in range(len(self._nodes)):
+            # Every cell touched by the bounding box of the node's circle,
+            # padded by one cell against rounding at the cell edges
+            ix0 = int((self._x[index] - self._r[index] - x0) // cell) - 1
+            ix1 = int((self._x[index] + self._r[index] - x0) // cell) + 1
+            iy0 = int((self._y[index] - self._r[index] - y0) // cell) - 1
+            iy1 = int((self._y[index] + self._r[index] - y0) // cell) + 1
+            for iy in range(max(iy0, 0), min(iy1, ny - 1) + 1):
+                for ix in range(max(ix0, 0), min(ix1, nx - 1) + 1):
+                    cells[iy * nx + ix].append(index)
+        # Candidates stay in node order so the first hit is the first match
+        width = max(len(candidates) for candidates in cells) or 1
+        table = np.full((nx * ny, width), -1, dtype=np.int64)
+        for i, candidates in enumerate(cells):
+            table[i, :len(candidates)] = candidates
+        return x0, y0, cell, nx, ny, table
+
+    def _assign_grid(self, x, y):
+        x0, y0, cell, nx, ny, table = self._grid
+        nodes = np.full(x.shape, -1, dtype=np.int64)
+        with np.errstate(invalid='ignore'):
+            ix = np.floor((x - x0) / cell)
+            iy = np.floor((y - y0) / cell)
+        on_grid = (ix >= 0) & (ix < nx) & (iy >= 0) & (iy < ny)
+        if not on_grid.any():
+            return nodes
+        cell_index = (iy[on_grid] * nx + ix[on_grid]).astype(np.int64)
+        candidates = table[cell_index]
+        valid = candidates >= 0
+        safe = np.where(valid, candidates, 0)
+        px = x[on_grid][:, None]
+        py = y[on_grid][:, None]
+        inside = valid & (np.sqrt((self._x[safe] - px)**2 + (self._y[safe] - py)**2) <= self._r[safe])
+        first = inside.argmax(axis=1)
+        nodes[on_grid] = np.where(inside.any(axis=1), candidates[np.arange(len(first)), first], -1)
+        return nodes
@@ -0,0 +1,178 @@
+# -*- coding: utf-8 -*-
+
+import numbers
+import os
+import shutil
+
+FORMATS = ('csv', 'parquet', 'feather')
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet', 'feather': '.feather'}
+
+# Parquet output is split into directories by these columns
+PARTITION_COLUMNS = ['Type', 'trial_index']
+
+STRING_COLUMNS = ('Type', 'Event', 'event', 'Eye')
+# Columns every row has, stored as integers; all other columns are floats
+INT_COLUMNS = ('trial_index',)
+
+# Parquet rows are stored with their position in the parsed data, since the
+# partitions are read back in Type and (lexical) trial_index order
+ROW_COLUMN = '_row'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Install pyarrow to read and write parquet or feather eye data')
+    return pyarrow
+
+
+def _trial_list(trial_index):
+    """ A trial_index or any iterable of them, e.g. a range, as a list; None stays None. """
+    if trial_index is None:
+        return None
+    if isinstance(trial_index, numbers.Integral):
+        return [trial_index]
+    return list(trial_index)
+
+
+def _schema(pa):
+    from eyelinkparser._columns import COLUMNS
+    # One schema for every chunk: ints that can be missing are stored as floats
+    return pa.schema([(name, pa.string() if name in STRING_COLUMNS else
+                       pa.int64() if name in INT_COLUMNS else pa.float64())
+                      for name in COLUMNS])
+
+
+def _normalize(chunk):
+    """ Reindexes a chunk to COLUMNS with the dtypes of the stored schema. """
+    from eyelinkparser._columns import COLUMNS
+    chunk = chunk.reindex(columns=list(COLUMNS))
+    dtypes = {name: object if name in STRING_COLUMNS else
+              'int64' if name in INT_COLUMNS else 'float64' for name in COLUMNS}
+    return chunk.astype(dtypes)
+
+
+def eye_data_path(directory, name, fmt='csv'):
+    """ Output path of a participant's eye data in the given format. """
+    return os.path.join(directory, name + EXTENSIONS[fmt])
+
+
+def write_eye_data(chunks, path, fmt='csv'):
+    """
+    Writes an iterable of eye data DataFrames (e.g. from iter_asc_chunks) to
+    path as they arrive and returns the number of rows written. 'csv' and
+    'feather' write a single file, 'parquet' writes a directory partitioned
+    by Type and trial_index, with a _row column that read_eye_data uses
+    to restore the order the rows were written in.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown output format: {fmt}")
+    # pandas and the parser modules are only imported once data is read or
+    # written, so importing this module for FORMATS stays cheap
+    import pandas as pd
+    from eyelinkparser._columns import COLUMNS
+    if isinstance(chunks, pd.DataFrame):
+        chunks = [chunks]
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
+    n_rows = 0
+    if fmt == 'csv':
+        with open(path, 'w', newline='') as f:
+            for i, chunk in enumerate(chunks):
+                chunk.reindex(columns=COLUMNS).to_csv(f, index=False, header=i == 0)
+                n_rows += len(chunk)
+        return n_rows
+    pa = _pyarrow()
+    schema = _schema(pa)
+    if fmt == 'feather':
+        options = pa.ipc.IpcWriteOptions(compression='zstd')
+        with pa.ipc.new_file(path, schema, options=options) as writer:
+            for chunk in chunks:
+                writer.write_table(pa.Table.from_pandas(_normalize(chunk), schema=schema, preserve_index=False))
+                n_rows += len(chunk)
+        return n_rows
+    os.makedirs(path)
+    schema = schema.append(pa.field(ROW_COLUMN, pa.int64()))
+    for i, chunk in enumerate(chunks):
+        if not len(chunk):
+            continue
+        chunk = _normalize(chunk)
+        chunk[ROW_COLUMN] = range(n_rows, n_rows + len(chunk))
+        table = pa.Table.from_pandas(chunk, schema=schema, preserve_index=False)
+        pa.parquet.write_to_dataset(table, path, partition_cols=PARTITION_COLUMNS,
+                                    basename_template=f'part-{i:06d}-{{i}}.parquet')
+        n_rows += len(chunk)
+    return n_rows
+
+
+def read_eye_data(path, columns=None, types=None, trial_index=None):
+    """
+    Reads eye data written by write_eye_data, in any format. Only the given
+    columns are loaded, and rows can be limited to row Types and trial
+    indices; for parquet these prune whole partitions and row groups before
+    anything is read. An .asc path is read through its SampleCache, which
+    is built on first use. Requested columns a file does not have, such as
+    Count in files written before GazeBin rows existed, are all missing.
+    """
+    import pandas as pd
+    from eyelinkparser._columns import COLUMNS
+    from eyelinkparser._cache import load_samples
+    if path.endswith('.asc'):
+        return load_samples(path).to_frame(columns=columns, types=types, trial_index=trial_index)
+    if isinstance(types, str):
+        types = [types]
+    trial_index = _trial_list(trial_index)
+    if not (os.path.isdir(path) or path.endswith(('.parquet', '.feather'))):
+        usecols = None
+        if columns is not None:
+            wanted = set(columns) | {'Type', 'trial_index'}
+            usecols = wanted.__contains__
+        df = pd.read_csv(path, usecols=usecols)
+        if types is not None:
+            df = df[df['Type'].isin(types)]
+        if trial_index is not None:
+            df = df[df['trial_index'].isin(trial_index)]
+        if columns is not None:
+            df = df.reindex(columns=list(columns))
+        return df.reset_index(drop=True)
+    pa = _pyarrow()
+    ds = pa.dataset
+    if os.path.isdir(path):
+        dataset = ds.dataset(path, format='parquet', partitioning='hive')
+    else:
+        dataset = ds.dataset(path, format='feather')
+    expression = None
+    if types is not None:
+        expression = ds.field('Type').isin(list(types))
+    if trial_index is not None:
+        condition = ds.field('trial_index').isin(trial_index)
+        expression = condition if expression is None else expression & condition
+    read_columns = None
+    if columns is not None:
+        read_columns = [name for name in columns if name in dataset.schema.names]
+    ordered = ROW_COLUMN in dataset.schema.names
+    if ordered and read_columns is not None:
+        read_columns.append(ROW_COLUMN)
+    table = dataset.to_table(columns=read_columns, filter=expression)
+    if ordered:
+        table = table.sort_by(ROW_COLUMN).drop_columns([ROW_COLUMN])
+    elif os.path.isdir(path):
+        # Written before rows were numbered: at least keep trials in order
+        table = table.sort_by([(name, 'ascending') for name in ('trial_index', 'Time', 'Start')
+                               if name in table.column_names])
+    df = table.to_pandas()
+    if os.path.isdir(path):
+        # Partition values come back as dictionaries; restore the stored types
+        for name in PARTITION_COLUMNS:
+            if name in df:
+                df[name] = df[name].astype(object if name in STRING_COLUMNS else 'int64')
+        if columns is None:
+            df = df[[name for name in COLUMNS if name in df]]
+    if columns is not None:
+        df = df.reindex(columns=list(columns))
+    return df
@@ -0,0 +1,129 @@
+# -*- coding: utf-8 -*-
+
+from collections import namedtuple
+from functools import lru_cache
+
+# Everything TrialProcessor derives from a trial's graph, rewards and start.
+# Paths include the start node; path_rewards sum the rewards along each path
+# that are not None, and best_reward / average_reward leave out the start.
+TreeAnalysis = namedtuple('TreeAnalysis', [
+    'paths', 'path_rewards', 'best_path', 'best_reward', 'average_reward',
+    'df', 'type', 'connect_nodes', 'non_connect_nodes'])
+
+CACHE_SIZE = 4096
+
+
+def trial_key(graph, rewards, start):
+    """
+    Hashable key of a trial's tree. Reward types are part of the key, so
+    configurations that differ only in 1 versus 1.0 are kept apart.
+    """
+    return (tuple(map(tuple, graph)), tuple(rewards), tuple(map(type, rewards)), start)
+
+
+def analyze_tree(graph, rewards, start):
+    """
+    Analyzes a trial's tree in a single walk over its paths. Results are
+    cached by trial_key, since the same configurations repeat across
+    participants.
+    """
+    return _analyze(trial_key(graph, rewards, start))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _analyze(key):
+    graph, rewards, _, start = key
+    paths, path_rewards, leaf_rewards = [], [], []
+
+    def walk(node, path, reward, path_reward):
+        if node >= len(graph) or not graph[node]:  # Leaf node
+            paths.append(path)
+            path_rewards.append(path_reward)
+            leaf_rewards.append(reward)
+            return reward, 1
+        total_reward, total_paths = 0, 0
+        for child in graph[node]:
+            child_reward = rewards[child]
+            child_total, child_paths = walk(
+                child, path + (child,), reward + child_reward,
+                path_reward if child_reward is None else path_reward + child_reward)
+            total_reward += child_total
+            total_paths += child_paths
+        return total_reward, total_paths
+
+    start_reward = 0 if rewards[start] is None else 0 + rewards[start]
+    total_reward, total_paths = walk(start, (start,), 0, start_reward)
+    best_reward = max(leaf_rewards)
+    average_reward = best_reward - ((total_reward - best_reward) / (total_paths - 1))
+    best_path = paths[path_rewards.index(max(path_rewards))]
+    df, trial_type = categorize_paths(paths, path_rewards)
+    connect_nodes, non_connect_nodes = connected_nodes(graph, start)
+    return TreeAnalysis(tuple(paths), tuple(path_rewards), best_path, best_reward, average_reward,
+                        df, trial_type, tuple(connect_nodes), tuple(non_connect_nodes))
+
+
+def categorize_paths(paths, path_rewards):
+    """
+    The (df, type) category of a tree from its paths and path rewards: on
+    which side of the start node the best path lies relative to the others.
+    """
+    # Function to check if two paths share the same immediate child of the start node
+    def same_side(path1, path2):
+        if len(path1) > 1 and len(path2) > 1:
+            return path1[1] == path2[1]
+        return False
+
+    if len(path_rewards) == 3:
+        max_reward = max(path_rewards)
+        max_index = path_rewards.index(max_reward)
+
+        remaining_rewards = [r for r in path_rewards if r != max_reward]
+        second_best_reward = max(remaining_rewards)
+        second_best_index = path_rewards.index(second_best_reward)
+
+        min_reward = min(path_rewards)
+        min_index = path_rewards.index(min_reward)
+
+        if same_side(paths[max_index], paths[second_best_index]):
+            return (1, "best_second")
+        elif same_side(paths[max_index], paths[min_index]):
+            return (1, "best_min")
+        else:
+            return (1, "best_alone")
+
+    elif len(path_rewards) == 4:
+        max_reward = max(path_rewards)
+        max_index = path_rewards.index(max_reward)
+
+        remaining_rewards = [r for r in path_rewards if r != max_reward]
+        second_best_reward = max(remaining_rewards)
+        second_best_index = path_rewards.index(second_best_reward)
+
+        min_reward = min(path_rewards)
+        min_index = path_rewards.index(min_reward)
+
+        if same_side(paths[max_index], paths[second_best_index]):
+            return (2, "best_second")
+        elif same_side(paths[max_index], paths[min_index]):
+            return (2, "best_min")
+        else:
+            return (2, "best_third")
+
+    return (None, "undefined")
+
+
+def connected_nodes(graph, start):
+    """ Nodes reachable from start in depth-first order, and all other nodes. """
+    connect_nodes = []
+    non_connect_nodes = list(range(len(graph)))  # Initialize all nodes as potentially non-connected
+
+    def dfs(node):
+        if node not in connect_nodes:
+            connect_nodes.append(node)
+            non_connect_nodes.remove(node)  # Mark node as connected by removing from non-connected list
+            for child in graph[node]:
+                if child not in connect_nodes:
+                    dfs(child)
+
+    dfs(start)
+    return connect_nodes, non_connect_nodes
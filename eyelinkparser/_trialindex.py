@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+import json
+import math
+import os
+from eyelinkparser._eyelinkparser import EyeLinkParser
+from eyelinkparser._manifest import parser_version, write_json
+from eyelinkparser._storage import _trial_list
+from eyelinkparser import _mmapreader
+
+# Bumped whenever the layout of the index file changes
+INDEX_VERSION = 1
+
+# The EyeLinkParser attributes a trial's parsing starts from
+STATE = ('current_offset', 'trial_index', 'event', 'visit', 'switch')
+
+
+class TrialIndex:
+    """
+    Where every trial of one samples.asc starts, stored next to it in
+    <samples.asc>.idx.json, so single trials can be parsed without reading
+    the whole file. Trial k starts at the line of its 'initialize' message
+    and runs up to the next one; trial 0 is everything before the first.
+    For every trial the index keeps the byte offset of that line and the
+    parser state just before it (current_offset, trial_index, event, visit
+    and switch), which EyeLinkParser.parse_asc_trials restores.
+
+    The index is built by one scan over the MSG lines only and records the
+    size and mtime of the ASC file and the parser version; it is only used
+    while they match.
+    """
+
+    SUFFIX = '.idx.json'
+
+    def __init__(self, asc_path):
+        self.asc_path = asc_path
+        self.path = asc_path + self.SUFFIX
+        self.meta = None
+        self.trials = []
+
+    def is_current(self):
+        """ True if the index was built from the ASC file as it is now, by this parser version. """
+        meta = self._read()
+        if (meta is None or meta['index_version'] != INDEX_VERSION or
+                meta['parser_version'] != parser_version()):
+            return False
+        stat = os.stat(self.asc_path)
+        return stat.st_size == meta['size'] and stat.st_mtime_ns == meta['mtime_ns']
+
+    def build(self, asc_encoding='ISO-8859-1'):
+        """
+        Scans the MSG lines of the ASC file and (re)writes the index.
+        Messages go through EyeLinkParser.parse_message, so the recorded
+        state is the one a full parse has at that line. Returns self.
+        """
+        stat = os.stat(self.asc_path)
+        parser = EyeLinkParser(eye_folder=os.path.dirname(self.asc_path), asc_encoding=asc_encoding,
+                               columnar=True, gaze='none')
+        trials = [{'trial_index': 0, 'offset': 0, 'state': self._state(parser)}]
+        with _mmapreader.open_buffer(self.asc_path) as buffer:
+            for start, line in _message_lines(buffer):
+                state = self._state(parser)
+                parser.parse_message(line.decode(asc_encoding))
+                if parser.trial_index != state['trial_index']:
+                    trials.append({'trial_index': parser.trial_index, 'offset': start, 'state': state})
+        self.meta = {
+            'source': os.path.basename(self.asc_path),
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'parser_version': parser_version(),
+            'index_version': INDEX_VERSION,
+            'asc_encoding': asc_encoding,
+            'n_trials': len(trials) - 1,
+        }
+        self.trials = trials
+        write_json(self.path, {**self.meta, 'trials': trials})
+        return self
+
+    def load(self):
+        """ Reads the index file. Returns self. """
+        content = self._read()
+        if content is None:
+            raise FileNotFoundError(f"No trial index at {self.path}")
+        self.trials = content.pop('trials')
+        self.meta = content
+        return self
+
+    def __len__(self):
+        """ The number of trials, not counting trial 0. """
+        return len(self.trials) - 1 if self.trials else 0
+
+    def spans(self, trial_index):
+        """
+        (start, end, state) of the bytes to parse for a trial_index or an
+        iterable of them, e.g. a range, in file order. Consecutive trials
+        make one span, parsed from the state of the first.
+        """
+        spans = []
+        for k in sorted(set(_trial_list(trial_index))):
+            if not 0 <= k < len(self.trials):
+                raise IndexError(f"No trial {k} in {self.asc_path} ({len(self)} trials)")
+            start = self.trials[k]['offset']
+            end = self.trials[k + 1]['offset'] if k + 1 < len(self.trials) else self.meta['size']
+            if spans and spans[-1][1] == start:
+                spans[-1] = (spans[-1][0], end, spans[-1][2])
+            else:
+                spans.append((start, end, self._restored(self.trials[k]['state'])))
+        return spans
+
+    def _state(self, parser):
+        state = {name: getattr(parser, name) for name in STATE}
+        if math.isnan(state['current_offset']):
+            state['current_offset'] = None  # JSON has no NaN
+        return state
+
+    def _restored(self, state):
+        state = dict(state)
+        if state['current_offset'] is None:
+            state['current_offset'] = math.nan
+        return state
+
+    def _read(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as file:
+            return json.load(file)
+
+
+def _message_lines(buffer):
+    """ (byte offset, line) of every line containing MSG, as EyeLinkParser.parse_line checks. """
+    pos = buffer.find(b'MSG')
+    while pos >= 0:
+        start = buffer.rfind(b'\n', 0, pos) + 1
+        end = buffer.find(b'\n', pos)
+        end = len(buffer) if end < 0 else end + 1
+        yield start, buffer[start:end]
+        pos = buffer.find(b'MSG', end)
+
+
+def load_trial_index(asc_path, asc_encoding='ISO-8859-1'):
+    """
+    The TrialIndex of an ASC file, loaded; it is built first if it is
+    missing or out of date.
+    """
+    index = TrialIndex(asc_path)
+    if not index.is_current():
+        return index.build(asc_encoding=asc_encoding)
+    return index.load()
@@ -1,40 +1,49 @@
 import os
-import sys
-import json
 import pandas as pd
-import subprocess
-from config import VERSION
+from itertools import chain
+import numpy as np
+from eyelinkparser._trees import analyze_tree, connected_nodes
+from eyelinkparser._jsonio import JSONSerializer
 
 class TrialProcessor:
-    def __init__(self, version):
+    def __init__(self, version, serializer=None):
         self.version = version
         self.processed_trials = []
-        self.setup_directories()
+        self.serializer = serializer or JSONSerializer()
 
     def setup_directories(self):
+        """ Creates the output directories; process_file calls this before writing. """
         os.makedirs(f'data/processed/{self.version}/practice_data', exist_ok=True)
         os.makedirs(f'data/processed/{self.version}/trial_data', exist_ok=True)
 
-    def process_file(self, filepath):
+    def process_file(self, filepath, lazy=False):
+        """
+        Saves a participant's practice data and returns their processed
+        trials, or with lazy=True a generator of them to pass to save_data.
+        """
         print(f"Processing file: {filepath}")
         try:
-            with open(filepath) as f:
-                data = json.load(f)
+            data = self.serializer.load(filepath)
         except FileNotFoundError:
             print(f"Error: File not found {filepath}")
             return None
+        wid = os.path.basename(filepath).replace('.json', '')
+        return self.process_data(data, wid, lazy=lazy)
 
+    def process_data(self, data, wid, lazy=False):
+        """ process_file for experiment data that has already been read, e.g. prefetched. """
         # Assume data has "practice_data" and "trial_data"
-        wid = os.path.basename(filepath).replace('.json', '')
 
         # Save practice data
-        practice_data_path = f'data/processed/{self.version}/practice_data/{wid}.json'
-        with open(practice_data_path, 'w') as f:
-            json.dump(data["practice_data"], f, indent=4)
+        self.setup_directories()
+        practice_data_path = f'data/processed/{self.version}/practice_data/{wid}{self.serializer.extension}'
+        self.serializer.dump(data["practice_data"], practice_data_path)
         
         # Process trial data
         if isinstance(data["trial_data"], list):
             trial_data = pd.DataFrame(data["trial_data"])
+            if lazy:
+                return self.iter_trials(trial_data, wid)
             trial_data = self.process_trial(trial_data, wid)  # Assuming this method updates and returns processed trial data
             if isinstance(trial_data, pd.DataFrame):
                 trial_data = trial_data.to_dict(orient='records')  # Convert to a list of dicts for JSON saving
@@ -45,39 +54,25 @@ class TrialProcessor:
         
 
     def save_data(self, data, path):
+        """ Writes records, a DataFrame or a generator of records; returns the number written. """
         if isinstance(data, pd.DataFrame):
             data = data.to_dict(orient='records')  # Convert DataFrame to list of dicts
-        with open(path, 'w') as f:
-            json.dump(data, f, indent=4)  # Saving the data as JSON
+        if isinstance(data, dict):
+            self.serializer.dump(data, path)
+            return 1
+        return self.serializer.write_records(data, path)  # Saving the data as JSON
 
 
     
+    def analyze_tree(self, graph, rewards, start):
+        """ Paths, rewards and categories of a trial's tree, cached across trials. """
+        return analyze_tree(graph, rewards, start)
+
     def calculate_best_reward(self,graph, rewards, start):
-        def dfs(node, current_reward, include_reward=True):
-            if include_reward:
-                current_reward += rewards[node]
-            if node >= len(graph) or not graph[node]:  # Leaf node
-                return current_reward
-            return max(dfs(child, current_reward) for child in graph[node])
-        return dfs(start, 0, include_reward=False)
+        return self.analyze_tree(graph, rewards, start).best_reward
 
     def calculate_average_reward(self, graph, rewards, start):
-        def dfs(node, current_reward, include_reward=True):
-            if include_reward:
-                current_reward += rewards[node]
-            if node >= len(graph) or not graph[node]:  # Leaf node
-                return current_reward, 1  # Return current reward and count this path as 1
-            total_reward, total_paths = 0, 0
-            for child in graph[node]:
-                child_reward, child_paths = dfs(child, current_reward)
-                total_reward += child_reward
-                total_paths += child_paths
-            return total_reward, total_paths
-
-        total_reward, total_paths = dfs(start, 0, include_reward=False)
-        best_reward = self.calculate_best_reward(graph, rewards, start)
-        average_reward = best_reward - ((total_reward - best_reward) / (total_paths-1) )
-        return average_reward
+        return self.analyze_tree(graph, rewards, start).average_reward
 
     def calculate_diff_2nd(self, events, rewards, graph):
         default_result = (None, None, None)
@@ -163,84 +158,16 @@ class TrialProcessor:
         return path_rewards
 
     def categorize_path(self, graph, start, rewards):
-        paths = self.calculate_paths(graph, start)
-        path_rewards = self.calculate_reward(paths, rewards)
-        
-        # Function to check if two paths share the same immediate child of the start node
-        def same_side(start_node, path1, path2):
-            if len(path1) > 1 and len(path2) > 1:
-                return path1[1] == path2[1]
-            return False
-        
-        if len(path_rewards) == 3:
-            max_reward = max(path_rewards)
-            max_index = path_rewards.index(max_reward)
-            
-            remaining_rewards = [r for r in path_rewards if r != max_reward]
-            second_best_reward = max(remaining_rewards)
-            second_best_index = path_rewards.index(second_best_reward)
-            
-            min_reward = min(path_rewards)
-            min_index = path_rewards.index(min_reward)
-            
-            if same_side(start, paths[max_index], paths[second_best_index]):
-                return (1, "best_second")
-            elif same_side(start, paths[max_index], paths[min_index]):
-                return (1, "best_min")
-            else:
-                return (1, "best_alone")
-        
-        elif len(path_rewards) == 4:
-            max_reward = max(path_rewards)
-            max_index = path_rewards.index(max_reward)
-            
-            remaining_rewards = [r for r in path_rewards if r != max_reward]
-            second_best_reward = max(remaining_rewards)
-            second_best_index = path_rewards.index(second_best_reward)
-            
-            third_best_reward = sorted(remaining_rewards)[-2]
-            third_best_index = path_rewards.index(third_best_reward)
-            
-            min_reward = min(path_rewards)
-            min_index = path_rewards.index(min_reward)
-            
-            if same_side(start, paths[max_index], paths[second_best_index]):
-                return (2, "best_second")
-            elif same_side(start, paths[max_index], paths[min_index]):
-                return (2, "best_min")
-    #         elif same_side(start, paths[max_index], paths[third_best_index]):
-    #             return (2, "best_third")
-            else:
-                return (2, "best_third")
-
-        return (None, "undefined")
+        analysis = self.analyze_tree(graph, rewards, start)
+        return (analysis.df, analysis.type)
 
     def find_connected_nodes(self, graph, start):
-        connected_nodes = []  # Use a list to store connected nodes
-        non_connected_nodes = list(range(len(graph)))  # Initialize all nodes as potentially non-connected
-
-        def dfs(node):
-            if node not in connected_nodes:
-                connected_nodes.append(node)
-                non_connected_nodes.remove(node)  # Mark node as connected by removing from non-connected list
-                for child in graph[node]:
-                    if child not in connected_nodes:
-                        dfs(child)
-
-        dfs(start)  # Start DFS from the starting node
-
-        return connected_nodes, non_connected_nodes
-
+        return connected_nodes(graph, start)
 
 
     def accuracy_first(self, events, graph, rewards, start):
-        # Calculate all possible paths from the start node
-        all_paths = self.calculate_paths(graph, start)
-        # Calculate rewards for each path
-        path_rewards = self.calculate_reward(all_paths, rewards)
-        # Find the best path based on the maximum reward
-        best_path_index = path_rewards.index(max(path_rewards))
-        best_path = all_paths[best_path_index]
+        # The best path is the first path with the maximum reward
+        best_path = self.analyze_tree(graph, rewards, start).best_path
 
         # Collect all visited states from the events
         visited_nodes = [event['state'] for event in events if 'state' in event]
@@ -255,8 +182,11 @@ class TrialProcessor:
         return accuracy
 
     def process_trial(self, data, wid):
+        return list(self.iter_trials(data, wid))
+
+    def iter_trials(self, data, wid):
+        """ Yields the processed trials of process_trial one at a time. """
         trial_index = 0
-        processed_trials = []
 
         for index, row in data.iterrows():
             trial = row['trial']
@@ -267,12 +197,11 @@ class TrialProcessor:
             start = trial['start']
 
             # Calculate additional data
-            best_reward = self.calculate_best_reward(graph, rewards, start)
-            average_reward = self.calculate_average_reward(graph, rewards, start)
-            current_reward = sum(rewards[node] for node in set(event['state'] for event in events if 'state' in event) if rewards[node] is not None)
-            connected_nodes, non_connected_nodes = self.find_connected_nodes(graph, start)
-            df, trial_type = self.categorize_path(graph, start, rewards)
-            difficulty = self.round_up(self.calculate_average_reward(graph, rewards, start))
+            analysis = self.analyze_tree(graph, rewards, start)
+            best_reward = analysis.best_reward
+            connected_nodes, non_connected_nodes = list(analysis.connect_nodes), list(analysis.non_connect_nodes)
+            df, trial_type = analysis.df, analysis.type
+            difficulty = self.round_up(analysis.average_reward)
         
             visited_nodes = set(event['state'] for event in events if 'state' in event)
             current_reward = sum(rewards[node] for node in visited_nodes if rewards[node] is not None)
@@ -314,10 +243,86 @@ class TrialProcessor:
                 'accuracy_1': accuracy_1,
                 'df': df
             }
-            
-            processed_trials.append(processed_trial)
-
-        return processed_trials
-
-
 
+            yield processed_trial
+
+
+
+    def process_trials(self, data, wid):
+        """
+        Batch version of process_trial: the same fields, as a DataFrame with
+        one row per trial. All trials' events are flattened into one event
+        table, so response times, choices, loss and accuracy come from
+        grouped operations instead of a loop per trial. Missing values are
+        NaN instead of None.
+        """
+        n_trials = len(data)
+        trials = list(data['trial'])
+        events = list(data['events'])
+        trial_index = np.arange(1, n_trials + 1)
+
+        # One row per event, with the position of its trial
+        lengths = np.fromiter(map(len, events), dtype=np.int64, count=n_trials)
+        event_table = pd.DataFrame.from_records(list(chain.from_iterable(events)), columns=['event', 'state', 'time'],
+                                                nrows=int(lengths.sum()))
+        event_table['trial'] = np.repeat(np.arange(n_trials), lengths)
+
+        # Response times from the first three visits
+        visits = event_table[event_table['event'] == 'visit']
+        visit_number = visits.groupby('trial').cumcount().to_numpy()
+        visit_times = np.full((n_trials, 3), np.nan)
+        first_three = visit_number < 3
+        visit_times[visits['trial'].to_numpy()[first_three], visit_number[first_three]] = visits['time'].to_numpy()[first_three]
+        complete = np.bincount(visits['trial'], minlength=n_trials) >= 3
+        visit_times[~complete] = np.nan
+        RT_first = (visit_times[:, 1] - visit_times[:, 0]) * 1000
+        RT_second = (visit_times[:, 2] - visit_times[:, 1]) * 1000
+        RT = (visit_times[:, 2] - visit_times[:, 0]) * 1000
+
+        # Visited states, their rewards and the first step
+        states = event_table.dropna(subset=['state'])
+        state_trial = states['trial'].to_numpy()
+        state = states['state'].to_numpy(dtype=np.int64)
+        rewards = pd.DataFrame([trial['rewards'] for trial in trials]).astype(float).to_numpy()
+        visited = ~pd.DataFrame({'trial': state_trial, 'state': state}).duplicated().to_numpy()
+        current_reward = np.bincount(state_trial[visited], weights=np.nan_to_num(rewards[state_trial[visited], state[visited]]),
+                                     minlength=n_trials)
+        starts = np.searchsorted(state_trial, np.arange(n_trials))
+        state_list = state.tolist()
+        ends = np.append(starts[1:], len(state)).tolist()
+        choice = [list(set(state_list[start:end])) for start, end in zip(starts.tolist(), ends)]
+        second_state = np.full(n_trials, -1, dtype=np.int64)
+        has_second = np.bincount(state_trial, minlength=n_trials) > 1
+        second_state[has_second] = state[starts[has_second] + 1]
+
+        analyses = [self.analyze_tree(trial['graph'], trial['rewards'], trial['start']) for trial in trials]
+        best_reward = np.array([analysis.best_reward for analysis in analyses], dtype=float)
+        best_step = np.array([analysis.best_path[1] if len(analysis.best_path) > 1 else -2 for analysis in analyses],
+                             dtype=np.int64)
+        layer1 = [list(self.calculate_diff_1st(e, trial['rewards'], trial['graph']))
+                  for e, trial in zip(events, trials)]
+        layer2 = [list(self.calculate_diff_2nd(e, trial['rewards'], trial['graph']))
+                  for e, trial in zip(events, trials)]
+
+        processed = pd.DataFrame(trials)
+        processed['choice'] = choice
+        processed['layer1'] = [nodes[:2] for nodes in layer1]
+        processed['layer2'] = [nodes[:2] for nodes in layer2]
+        processed['connect_nodes'] = [list(analysis.connect_nodes) for analysis in analyses]
+        processed['non_connect_nodes'] = [list(analysis.non_connect_nodes) for analysis in analyses]
+        processed['events'] = events
+        processed['trial_index'] = trial_index
+        processed['difficulty'] = np.array([self.round_up(analysis.average_reward) for analysis in analyses], dtype=float)
+        processed['difficulty_1'] = np.array([nodes[2] for nodes in layer1], dtype=float)
+        processed['difficulty_2'] = np.array([nodes[2] for nodes in layer2], dtype=float)
+        processed['type'] = [analysis.type for analysis in analyses]
+        processed['wid'] = wid
+        processed['RT_first_visit'] = RT_first
+        processed['RT_second_visit'] = RT_second
+        processed['RT'] = RT
+        processed['max_reward'] = best_reward
+        processed['loss'] = best_reward - current_reward
+        processed['accuracy'] = (current_reward == best_reward).astype(np.int64)
+        processed['accuracy_1'] = (second_state == best_step).astype(np.int64)
+        processed['df'] = np.array([analysis.df for analysis in analyses], dtype=float)
+        return processed